@@ -0,0 +1,24 @@
+# Day 2 part 2 in one pass: every noun/verb pair runs as a lane of a batch computer
+# python 002.2.batch.py 002.1.input.txt
+
+import sys
+import numpy as np
+from intcode import ProgramState
+from intcode_batch import BatchIntCodeComputer
+
+
+def main():
+    with open(sys.argv[1], "r") as f:
+        core = [int(c) for c in f.readline().strip().split(",")]
+
+    pairs = np.arange(100 * 100)
+    computer = BatchIntCodeComputer(core, len(pairs))
+    computer.set_noun_verb(pairs // 100, pairs % 100)
+    computer.run()
+
+    found = (computer.state == ProgramState.halt) & (computer.peek(0) == 19690720)
+    for pair in np.nonzero(found)[0]:
+        print(f"{pair // 100}, {pair % 100}")
+
+
+main()
@@ -17,11 +17,7 @@
 
 import sys
 
-
-class Grid(set):
-    def __init__(self, *args, **kwargs):
-        super().__init__(*args, **kwargs)
-        self.extent = None
+from grid import Grid
 
 
 def main():
@@ -31,7 +27,7 @@ def main():
 
 
 def load_grid():
-    grid = Grid()
+    grid = Grid(bits=1)
     grid.extent = [None, None]
     with open(sys.argv[1], "r") as f:
         y = 0
@@ -18,11 +18,7 @@ import time
 import sys
 from collections import deque
 
-
-class Grid(set):
-    def __init__(self, *args, **kwargs):
-        super().__init__(*args, **kwargs)
-        self.extent = None
+from grid import Grid
 
 
 def main():
@@ -46,7 +42,7 @@ def main():
 
 
 def load_grid():
-    grid = Grid()
+    grid = Grid(bits=1)
     grid.extent = [None, None]
     with open(sys.argv[1], "r") as f:
         y = 0
@@ -126,7 +122,9 @@ def mark(p1, dx, dy, grid):
 
 def plot_sweeps(p1, sight_lines, grid):
     for s in sight_lines:
-        g = Grid(s)
+        g = Grid(bits=1)
+        for p in s:
+            g.add(p)
         g.add(p1)
         g.extent = grid.extent
         print("-------")
@@ -1,5 +1,6 @@
 import sys
 from intcode import IntCodeComputer, ProgramState
+from grid import Grid
 
 
 class PaintingRobot:
@@ -42,7 +43,7 @@ def print_panel(panel, extent):
 
 def test_robots():
     instructions = [(1, 0), (0, 0), (1, 0), (1, 0), (0, 1), (1, 0), (1, 0)]
-    panel = {}
+    panel = Grid(bits=1)
     pr = PaintingRobot()
     for inst in instructions:
         pr.paint(inst[0], panel)
@@ -55,26 +56,18 @@ def test_robots():
 
 def run_robot_run(core):
 
-    panel = {}
+    panel = Grid(bits=1)
     pr = PaintingRobot()
 
     computer = IntCodeComputer()
     computer.load_core(core)
-    computer.state = ProgramState.running
-    while computer.state == ProgramState.running:
+    while 1:
         computer.set_input_buffer([pr.camera(panel)])
+        computer.run_until_output(2)
+        if computer.state != ProgramState.running:
+            return len(pr._painted_panels)
 
-        inst = [None, None]
-        while len(computer.output_buffer) == 0:
-            computer.step()
-            if computer.state != ProgramState.running:
-                return len(pr._painted_panels)
-
-        inst[0] = computer.output_buffer.pop()
-
-        while len(computer.output_buffer) == 0:
-            computer.step()
-        inst[1] = computer.output_buffer.pop()
+        inst = computer.output_buffer.drain()
 
         pr.paint(inst[0], panel)
         pr.turn(inst[1])
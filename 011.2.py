@@ -1,5 +1,6 @@
 import sys
 from intcode import IntCodeComputer, ProgramState
+from grid import Grid
 
 
 class PaintingRobot:
@@ -42,7 +43,7 @@ def print_panel(panel, extent):
 
 def test_robots():
     instructions = [(1, 0), (0, 0), (1, 0), (1, 0), (0, 1), (1, 0), (1, 0)]
-    panel = {}
+    panel = Grid(bits=1)
     pr = PaintingRobot()
     for inst in instructions:
         pr.paint(inst[0], panel)
@@ -59,21 +60,13 @@ def run_robot_run(panel, core):
 
     computer = IntCodeComputer()
     computer.load_core(core)
-    computer.state = ProgramState.running
-    while computer.state == ProgramState.running:
+    while 1:
         computer.set_input_buffer([pr.camera(panel)])
+        computer.run_until_output(2)
+        if computer.state != ProgramState.running:
+            return len(pr._painted_panels)
 
-        inst = [None, None]
-        while len(computer.output_buffer) == 0:
-            computer.step()
-            if computer.state != ProgramState.running:
-                return len(pr._painted_panels)
-
-        inst[0] = computer.output_buffer.pop()
-
-        while len(computer.output_buffer) == 0:
-            computer.step()
-        inst[1] = computer.output_buffer.pop()
+        inst = computer.output_buffer.drain()
 
         pr.paint(inst[0], panel)
         pr.turn(inst[1])
@@ -83,18 +76,10 @@ def main():
     with open(sys.argv[1], "r") as f:
         core = [int(c) for c in f.readline().strip().split(",")]
 
-    panel = {}
+    panel = Grid(bits=1)
     panel[(0, 0)] = 1
     run_robot_run(panel, core)
-
-    extent = (
-        min(p[0] for p in panel.keys()),
-        min(p[1] for p in panel.keys()),
-        max(p[0] for p in panel.keys()),
-        max(p[1] for p in panel.keys())
-    )
-
-    print_panel(panel, extent)
+    print_panel(panel, panel.bounds())
 
 
 # test_robots()
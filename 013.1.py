@@ -1,36 +1,30 @@
 # Arcade game
 import sys
-from intcode import IntCodeComputer, ProgramState
+from intcode import IntCodeComputer
+from grid import Grid
 
 
 def main():
     with open(sys.argv[1], "r") as f:
         core = [int(c) for c in f.readline().strip().split(",")]
 
-    screen = {}
+    screen = Grid()
 
     computer = IntCodeComputer()
     computer.load_core(core)
-    computer.state = ProgramState.running
-    while computer.state == ProgramState.running:
-        computer.step()
+    computer.run()
 
-        if len(computer.output_buffer) == 3:
-            x, y, t = computer.output_buffer
-            computer.output_buffer.clear()
-            screen[(x, y)] = t
+    out = computer.output_buffer.drain()
+    for i in range(0, len(out), 3):
+        x, y, t = out[i:i + 3]
+        screen[(x, y)] = t
 
-    print(len([s for s in screen.values() if s == 2]))
+    print(screen.count(2))
     print_screen(screen)
 
 
 def print_screen(screen):
-    extent = (
-        min(p[0] for p in screen.keys()),
-        min(p[1] for p in screen.keys()),
-        max(p[0] for p in screen.keys()),
-        max(p[1] for p in screen.keys())
-    )
+    extent = screen.bounds()
 
     legend = {
         0: " ",
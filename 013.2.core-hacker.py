@@ -2,13 +2,23 @@
 # Unabashed cheating by altering the core while the game is running
 # Create a paddle that extends the whole width of the screen
 
-import time
 from intcode import IntCodeComputer, ProgramState
+from grid import Grid
+from display import create_display
+
+
+legend = {
+    0: " ",
+    1: "#",
+    2: "*",
+    3: "_",
+    4: "o"
+}
 
 
 class Game:
     def __init__(self):
-        self.screen = {}
+        self.screen = Grid()
         self.score = 0
 
         # Internal state needed for learning
@@ -19,6 +29,14 @@ class Game:
         self._paddle_pos = 0
         self._paddle_pos_at_miss = 0
 
+        # Tiles of each kind on the screen, kept as they change so nothing has to count them.
+        # Empty tiles aren't counted
+        self.tile_counts = [0] * len(legend)
+        # Cells changed since the screen was last printed, and the extent it was printed
+        # with. Clear printed_extent to have the next frame print the whole screen
+        self.dirty = set()
+        self.printed_extent = None
+
     def set_state(self, x, y, t):
         if x == -1 and y == 0:
             self.score = max(self.score, t)
@@ -31,6 +49,13 @@ class Game:
                     self._ball_pos_at_miss = x
                     self._paddle_pos_at_miss = self._paddle_pos
 
+            old = self.screen[(x, y)]
+            if old != t:
+                if old:
+                    self.tile_counts[old] -= 1
+                if t:
+                    self.tile_counts[t] += 1
+                self.dirty.add((x, y))
             self.screen[(x, y)] = t
 
     def current_paddle_gap(self):
@@ -40,57 +65,79 @@ class Game:
         return self._ball_pos_at_miss - self._paddle_pos_at_miss
 
     def balls_left(self):
-        return sum(1 for v in self.screen.values() if v == 2)
+        return self.tile_counts[2]
 
     def draw(self):
         print(f"s={self.score} b={self.balls_left()}")
         self.print_screen()
 
     def print_screen(self):
-        extent = (
-            min(p[0] for p in self.screen.keys()),
-            min(p[1] for p in self.screen.keys()),
-            max(p[0] for p in self.screen.keys()),
-            max(p[1] for p in self.screen.keys())
-        )
-
-        legend = {
-            0: " ",
-            1: "#",
-            2: "*",
-            3: "_",
-            4: "o"
-        }
-
+        extent = self.screen.bounds()
         for j in range(extent[1], extent[3] + 1):
-            print("".join(legend[self.screen.get((i, j), 0)] for i in range(extent[0], extent[2] + 1)))
+            print("".join(legend[self.screen[(i, j)]] for i in range(extent[0], extent[2] + 1)))
+        self.dirty.clear()
+        self.printed_extent = extent
+
+    def print_changes(self, top):
+        # Puts the tiles changed since the screen was printed with its top row at terminal
+        # row top back in place, then leaves the cursor under the screen. Returns False
+        # without printing anything if the screen has grown since
+        extent = self.screen.bounds()
+        if extent != self.printed_extent:
+            return False
+        for x, y in self.dirty:
+            print(f"{chr(27)}[{top + y - extent[1]};{x - extent[0] + 1}H{legend[self.screen[(x, y)]]}", end="")
+        print(f"{chr(27)}[{top + extent[3] - extent[1] + 1};1H", end="", flush=True)
+        self.dirty.clear()
+        return True
 
 
 class ArcadeBox:
     def __init__(self, core, core_hacker_func):
         self.game = Game()
-        self.computer = IntCodeComputer()
+        self.computer = IntCodeComputer(fast=True)
         self.computer.load_core(core)
         self.computer.state = ProgramState.running
 
-        self.core_hacker_func = core_hacker_func
+        core_hacker_func(self.computer)
 
     def play_step(self, joy):
-        self.computer.input_buffer = [joy]
-        while len(self.computer.input_buffer) and self.computer.state == ProgramState.running:
+        # Run up to the next joystick read and let it take this move
+        self.computer.run_until_input_needed()
+        if self.computer.state == ProgramState.awaiting_input:
+            self.computer.set_input_buffer([joy])
             self.computer.step()
-            self.core_hacker_func(self.computer)
-            if len(self.computer.output_buffer) == 3:
-                x, y, t = self.computer.output_buffer
-                self.computer.output_buffer.clear()
-                self.game.set_state(x, y, t)
+
+        out = self.computer.output_buffer
+        while len(out) >= 3:
+            self.game.set_state(*out.drain(3))
 
     def display(self):
         self.game.draw()
 
 
+paddle_row = range(639 + 21*44 + 1, 639 + 21*44 + 43)
+
+
 def infinite_paddle(computer):
-    computer._core[639 + 21*44 + 1:639 + 21*44 + 43] = [3] * 42
+    # Fill the paddle row once, then put back any cell the game writes over
+    for i in paddle_row:
+        computer.write_value(i, 3)
+    computer.watch(paddle_row, on_write=keep_paddle)
+
+
+def keep_paddle(computer, i, v):
+    if v != 3:
+        computer.write_value(i, 3)
+
+
+def draw(box):
+    # Once the screen is up only the tiles that changed are rewritten
+    print(chr(27) + "[H", end="")
+    print(f"balls={box.game.balls_left()} score={box.game.score}" + chr(27) + "[K")
+    if not box.game.print_changes(top=2):
+        print(chr(27) + "[J", end="")
+        box.game.print_screen()
 
 
 def main():
@@ -99,14 +146,17 @@ def main():
 
     core[0] = 2  # Set mode to play for free
     box = ArcadeBox(core, infinite_paddle)
+    display = create_display()
 
-    last_score = 0
     while box.computer.state == ProgramState.running:
         box.play_step(0)
-        print(chr(27) + "[2J")
+        if display:
+            display.frame(draw, box, clear=False)
+
+    if display:
+        display.frame(draw, box, last=True, clear=False)
+    else:
         print(f"balls={box.game.balls_left()} score={box.game.score}")
-        box.display()
-        time.sleep(.05)
 
 
 main()
@@ -9,11 +9,21 @@ import pickle
 import sys
 from collections import deque
 from intcode import IntCodeComputer, ProgramState
+from grid import Grid
+
+
+legend = {
+    0: " ",
+    1: "#",
+    2: "*",
+    3: "_",
+    4: "o"
+}
 
 
 class Game:
     def __init__(self):
-        self.screen = {}
+        self.screen = Grid()
         self.score = 0
 
         # Internal state needed for learning
@@ -24,6 +34,10 @@ class Game:
         self._paddle_pos = 0
         self._paddle_pos_at_miss = 0
 
+        # Tiles of each kind on the screen, kept as they change so nothing has to count them.
+        # Empty tiles aren't counted
+        self.tile_counts = [0] * len(legend)
+
     def set_state(self, x, y, t):
         if x == -1 and y == 0:
             self.score = max(self.score, t)
@@ -36,6 +50,12 @@ class Game:
                     self._ball_pos_at_miss = x
                     self._paddle_pos_at_miss = self._paddle_pos
 
+            old = self.screen[(x, y)]
+            if old != t:
+                if old:
+                    self.tile_counts[old] -= 1
+                if t:
+                    self.tile_counts[t] += 1
             self.screen[(x, y)] = t
 
     def current_paddle_gap(self):
@@ -45,30 +65,16 @@ class Game:
         return self._ball_pos_at_miss - self._paddle_pos_at_miss
 
     def balls_left(self):
-        return sum(1 for v in self.screen.values() if v == 2)
+        return self.tile_counts[2]
 
     def draw(self):
         print(f"s={self.score} b={self.balls_left()}")
         self.print_screen()
 
     def print_screen(self):
-        extent = (
-            min(p[0] for p in self.screen.keys()),
-            min(p[1] for p in self.screen.keys()),
-            max(p[0] for p in self.screen.keys()),
-            max(p[1] for p in self.screen.keys())
-        )
-
-        legend = {
-            0: " ",
-            1: "#",
-            2: "*",
-            3: "_",
-            4: "o"
-        }
-
+        extent = self.screen.bounds()
         for j in range(extent[1], extent[3] + 1):
-            print("".join(legend[self.screen.get((i, j), 0)] for i in range(extent[0], extent[2] + 1)))
+            print("".join(legend[self.screen[(i, j)]] for i in range(extent[0], extent[2] + 1)))
 
 
 class ArcadeBox:
@@ -79,13 +85,15 @@ class ArcadeBox:
         self.computer.state = ProgramState.running
 
     def play_step(self, joy):
-        self.computer.input_buffer = [joy]
-        while len(self.computer.input_buffer) and self.computer.state == ProgramState.running:
+        # Run up to the next joystick read and let it take this move
+        self.computer.run_until_input_needed()
+        if self.computer.state == ProgramState.awaiting_input:
+            self.computer.set_input_buffer([joy])
             self.computer.step()
-            if len(self.computer.output_buffer) == 3:
-                x, y, t = self.computer.output_buffer
-                self.computer.output_buffer.clear()
-                self.game.set_state(x, y, t)
+
+        out = self.computer.output_buffer
+        while len(out) >= 3:
+            self.game.set_state(*out.drain(3))
 
     def display(self):
         self.game.draw()
@@ -138,28 +146,32 @@ def main():
     initial_moves = move_atoi(open("013.2.moves-checkpoint2.txt", "r").readline().strip())
     mv_no = 0
 
-    box = ArcadeBox(core)
-
-    last_score = 0
+    # Tracing keeps only the most recent instructions, so it can stay on for a whole game
+    box = ArcadeBox(core, debug=True)
 
     score_locs = []
+    # The game only sees the score once a move's output is drained, so several bricks
+    # broken in one move are measured from the score written before each of them
+    last_score = box.computer.peek(386)
+
+    def score_written(computer, i, score):
+        # 386 = score. [435] points at the entry of the score table that was just added
+        nonlocal last_score
+        sl = computer.peek(435)
+        score_locs.append((sl, computer.peek(sl), score - last_score))
+        last_score = score
+        # print(score_locs[-1])
+
+    box.computer.watch(386, on_write=score_written)
 
     while box.computer.state == ProgramState.running and mv_no < len(initial_moves):
         joy = initial_moves[mv_no]
         box.play_step(joy)
-        if box.game.score > last_score:
-            # print(f"balls={box.game.balls_left()} score={box.game.score}")
-            # print(f"{box.computer._core[435]}, {box.game.score}")
-            sl = box.computer._core[435]
-            score_locs += [(sl, box.computer._core[sl], box.game.score - last_score)]
-            # print(score_locs[-1])
-
-            last_score = box.game.score
         mv_no += 1
 
-    # print("\n".join(box.computer.get_log()))
+    # print("\n".join(box.computer.get_log()))  # the last 100k instructions
 
-    screen = {}
+    screen = Grid(bits=1)
     for l in score_locs:
         _n = l[0] - 1651
         # l = row * 44 + col
@@ -3,17 +3,28 @@
 # deterministic. The following code repeatedly plays the game learning with each round where to
 # move the paddle for the next round
 
-import time
+import copy
 import pathlib
 import pickle
 import sys
 from collections import deque
 from intcode import IntCodeComputer, ProgramState
+from grid import Grid
+from display import create_display
+
+
+legend = {
+    0: " ",
+    1: "#",
+    2: "*",
+    3: "_",
+    4: "o"
+}
 
 
 class Game:
     def __init__(self):
-        self.screen = {}
+        self.screen = Grid()
         self.score = 0
 
         # Internal state needed for learning
@@ -24,6 +35,14 @@ class Game:
         self._paddle_pos = 0
         self._paddle_pos_at_miss = 0
 
+        # Tiles of each kind on the screen, kept as they change so nothing has to count them.
+        # Empty tiles aren't counted
+        self.tile_counts = [0] * len(legend)
+        # Cells changed since the screen was last printed, and the extent it was printed
+        # with. Clear printed_extent to have the next frame print the whole screen
+        self.dirty = set()
+        self.printed_extent = None
+
     def set_state(self, x, y, t):
         if x == -1 and y == 0:
             self.score = max(self.score, t)
@@ -36,6 +55,13 @@ class Game:
                     self._ball_pos_at_miss = x
                     self._paddle_pos_at_miss = self._paddle_pos
 
+            old = self.screen[(x, y)]
+            if old != t:
+                if old:
+                    self.tile_counts[old] -= 1
+                if t:
+                    self.tile_counts[t] += 1
+                self.dirty.add((x, y))
             self.screen[(x, y)] = t
 
     def current_paddle_gap(self):
@@ -45,30 +71,31 @@ class Game:
         return self._ball_pos_at_miss - self._paddle_pos_at_miss
 
     def balls_left(self):
-        return sum(1 for v in self.screen.values() if v == 2)
+        return self.tile_counts[2]
 
     def draw(self):
         print(f"s={self.score} b={self.balls_left()}")
         self.print_screen()
 
     def print_screen(self):
-        extent = (
-            min(p[0] for p in self.screen.keys()),
-            min(p[1] for p in self.screen.keys()),
-            max(p[0] for p in self.screen.keys()),
-            max(p[1] for p in self.screen.keys())
-        )
-
-        legend = {
-            0: " ",
-            1: "#",
-            2: "*",
-            3: "_",
-            4: "o"
-        }
-
+        extent = self.screen.bounds()
         for j in range(extent[1], extent[3] + 1):
-            print("".join(legend[self.screen.get((i, j), 0)] for i in range(extent[0], extent[2] + 1)))
+            print("".join(legend[self.screen[(i, j)]] for i in range(extent[0], extent[2] + 1)))
+        self.dirty.clear()
+        self.printed_extent = extent
+
+    def print_changes(self, top):
+        # Puts the tiles changed since the screen was printed with its top row at terminal
+        # row top back in place, then leaves the cursor under the screen. Returns False
+        # without printing anything if the screen has grown since
+        extent = self.screen.bounds()
+        if extent != self.printed_extent:
+            return False
+        for x, y in self.dirty:
+            print(f"{chr(27)}[{top + y - extent[1]};{x - extent[0] + 1}H{legend[self.screen[(x, y)]]}", end="")
+        print(f"{chr(27)}[{top + extent[3] - extent[1] + 1};1H", end="", flush=True)
+        self.dirty.clear()
+        return True
 
 
 class ArcadeBox:
@@ -79,13 +106,15 @@ class ArcadeBox:
         self.computer.state = ProgramState.running
 
     def play_step(self, joy):
-        self.computer.input_buffer = [joy]
-        while len(self.computer.input_buffer) and self.computer.state == ProgramState.running:
+        # Run up to the next joystick read and let it take this move
+        self.computer.run_until_input_needed()
+        if self.computer.state == ProgramState.awaiting_input:
+            self.computer.set_input_buffer([joy])
             self.computer.step()
-            if len(self.computer.output_buffer) == 3:
-                x, y, t = self.computer.output_buffer
-                self.computer.output_buffer.clear()
-                self.game.set_state(x, y, t)
+
+        out = self.computer.output_buffer
+        while len(out) >= 3:
+            self.game.set_state(*out.drain(3))
 
     def display(self):
         self.game.draw()
@@ -130,15 +159,58 @@ class Learner:
         return moves_played
 
 
+class Replay:
+    # Checkpoints (a snapshot of the computer and a copy of the game) every `interval` moves
+    # of the last round. The learner only changes the tail of the moves, so the next round
+    # can start from the last checkpoint before its moves differ instead of from the start
+
+    def __init__(self, interval=100):
+        self.interval = interval
+        self.moves = []
+        self.checkpoints = {}
+
+    def record(self, box, moves_played):
+        n = len(moves_played)
+        if n % self.interval == 0 and n not in self.checkpoints:
+            self.checkpoints[n] = (box.computer.snapshot(), copy.deepcopy(box.game))
+
+    def finish_round(self, moves_played):
+        self.moves = list(moves_played)
+
+    def resume(self, game_core, joystick):
+        # A box at the latest checkpoint still valid for joystick and the number of moves it
+        # has played, or None
+        same = 0
+        for a, b in zip(self.moves, joystick):
+            if a != b:
+                break
+            same += 1
+
+        # Checkpoints past the first changed move are about to be played differently
+        for n in [n for n in self.checkpoints if n > same]:
+            del self.checkpoints[n]
+        if not self.checkpoints:
+            return None
+
+        n = max(self.checkpoints)
+        snapshot, game = self.checkpoints[n]
+        box = ArcadeBox(game_core)
+        box.computer.restore(snapshot)
+        box.game = copy.deepcopy(game)
+        return box, n
+
+
 class RobotPlayer:
 
     cache_file = pathlib.Path("013.2.cache.pkl")
 
-    def __init__(self, game_core, use_core_cache=False):
+    def __init__(self, game_core, use_core_cache=False, display=None):
+        self.display = display
         self.joystick = []
         self.learner = Learner()
         self.game_core = game_core
         self.use_core_cache = use_core_cache
+        self.replay = Replay()
 
     def load_from_cache(self):
         if self.cache_file.exists():
@@ -146,53 +218,64 @@ class RobotPlayer:
         else:
             return None
 
-        if cache.get("original_core") == self.game_core:
+        if cache.get("original_core") == self.game_core and "snapshot" in cache:
             mp = cache.get("moves_played")
             if mp == self.joystick[:len(mp)]:
                 return cache
 
     def save_core_cache(self, box, moves_played):
+        # The computer is saved as a snapshot of what changed in the core, not the whole core
         cache = {
             "original_core": self.game_core,
-            "arcadebox": box,
+            "snapshot": box.computer.snapshot(),
+            "game": box.game,
             "moves_played": moves_played
         }
         pickle.dump(cache, self.cache_file.open("wb"))
 
     def play_round(self, display_last=0):
         cache = self.load_from_cache()
-        if cache is not None and self.use_core_cache:
-            box = cache.get("arcadebox")
+        resumed = self.replay.resume(self.game_core, self.joystick)
+        if resumed is not None and (cache is None or not self.use_core_cache or
+                                    resumed[1] > len(cache.get("moves_played"))):
+            box, n = resumed
+            moves_played = self.joystick[:n]
+            proposed_moves = deque(self.joystick[n:])
+        elif cache is not None and self.use_core_cache:
+            box = ArcadeBox(self.game_core)
+            box.computer.restore(cache.get("snapshot"))
+            box.game = cache.get("game")
             moves_played = cache.get("moves_played")
             proposed_moves = deque(self.joystick[len(moves_played):])
         else:
             box = ArcadeBox(self.game_core)
             moves_played = []
             proposed_moves = deque(self.joystick)
+        # Whatever the terminal shows isn't this box's screen
+        box.game.printed_extent = None
 
         while box.computer.state == ProgramState.running:
             if len(proposed_moves) == 50:  # Don't make this too small ...
                 self.save_core_cache(box, moves_played)
+            self.replay.record(box, moves_played)
 
             joy = proposed_moves.popleft() if proposed_moves else 0
 
             moves_played += [joy]
             box.play_step(joy)
-            print(chr(27) + "[2J")
-            print(printable_moves(moves_played)[-44:])
-            print(f"balls={box.game.balls_left()} score={box.game.score}")
-            box.display()
-            time.sleep(.05)
+            if self.display:
+                self.display.frame(draw_move, box, moves_played, clear=False)
+
+        self.replay.finish_round(moves_played)
 
         # Discard last move
         moves_played = moves_played[:-1]
         self.joystick = self.learner.learn(box, moves_played)
 
-        print(chr(27) + "[2J")
-        print(f"miss={box.game.paddle_gap_at_miss()}")
-        print(f"balls={box.game.balls_left()} score={box.game.score}")
-        box.display()
-        time.sleep(1)
+        if self.display:
+            self.display.frame(draw_round, box, last=True)
+        else:
+            print(f"miss={box.game.paddle_gap_at_miss()} balls={box.game.balls_left()} score={box.game.score}")
 
         return box.game.balls_left()
 
@@ -210,6 +293,23 @@ class RobotPlayer:
                 f.write(printable_moves(self.joystick))
 
 
+def draw_move(box, moves_played):
+    # Rewrites the two status lines and only the tiles that changed, unless the whole
+    # screen has to be printed again
+    print(chr(27) + "[H", end="")
+    print(printable_moves(moves_played)[-44:] + chr(27) + "[K")
+    print(f"balls={box.game.balls_left()} score={box.game.score}" + chr(27) + "[K")
+    if not box.game.print_changes(top=3):
+        print(chr(27) + "[J", end="")
+        box.game.print_screen()
+
+
+def draw_round(box):
+    print(f"miss={box.game.paddle_gap_at_miss()}")
+    print(f"balls={box.game.balls_left()} score={box.game.score}")
+    box.display()
+
+
 def main():
     with open("013.1.input.txt", "r") as f:
         core = [int(c) for c in f.readline().strip().split(",")]
@@ -218,7 +318,7 @@ def main():
     initial_moves = open("013.2.moves.txt", "r").readline().strip()
     # initial_moves = open("013.2.moves-checkpoint1.txt", "r").readline().strip()
     # initial_moves = None
-    player = RobotPlayer(core, use_core_cache=True)
+    player = RobotPlayer(core, use_core_cache=True, display=create_display())
     player.play_to_win(initial_moves, display_last=5)
 
 
@@ -22,86 +22,55 @@
 # step. The core is 3KB - we can afford to have a few copies floating
 # around
 #
+# The droids use paged memory, so a clone shares the core with its parent
+# and only copies the few pages the move actually writes to.
+#
 
-import time
-from collections import deque
-from intcode import IntCodeComputer, ProgramState
-
-
-news = {
-    1: (0, 1),
-    2: (0, -1),
-    3: (-1, 0),
-    4: (1, 0)
-}
-
-
-def new_loc(loc, move):
-    m = news[move]
-    return loc[0] + m[0], loc[1] + m[1]
-
-
-class Droid:
-    def __init__(self, computer, loc, depth):
-        self.computer = computer
-        self.loc = loc
-        self.depth = depth
-
-    def clone_and_move(self, move):
-        new_droid = Droid(self.computer.clone(), new_loc(self.loc, move), self.depth + 1)
-        new_droid.computer.set_input_buffer([move])
-        while len(new_droid.computer.output_buffer) == 0:
-            new_droid.computer.step()
-        res = new_droid.computer.output_buffer.pop()
-        return res, new_droid
-
-
-all_moves = [1, 2, 3, 4]
+# The search now lives in intcode_explorer, which maps the whole area in one pass and
+# answers the distance from the map.
+#
+# Run with --depth-first to map with the one physical robot instead: it explores depth
+# first and walks back to backtrack, so nothing is cloned whatever the shape of the area.
+#
 
+import sys
 
-def new_locs(loc, depth):
-    return [(new_loc(loc, m), depth) for m in all_moves]
+from intcode import IntCodeComputer, ProgramState
+from intcode_explorer import Explorer
+from intcode_memory import MemoryModel
+from display import create_display
 
 
 def main():
     with open("015.1.input.txt", "r") as f:
         core = [int(c) for c in f.readline().strip().split(",")]
 
-    visited = {(0, 0): 3}
-    computer = IntCodeComputer()
+    computer = IntCodeComputer(memory=MemoryModel.paged)
     computer.load_core(core)
     computer.state = ProgramState.running
-    search_q = deque([Droid(computer, loc=(0, 0), depth=0)])
+    explorer = Explorer(computer)
+    display = create_display(fps=10)
 
-    while search_q:
-        droid = search_q.popleft()
-        for move in all_moves:
-            res, new_droid = droid.clone_and_move(move)
-            if res == 0:
-                visited[new_droid.loc] = 1
-                continue
-            elif res == 1:
-                if new_droid.loc in visited:
-                    continue
-                else:
-                    search_q.append(new_droid)
-                    visited[new_droid.loc] = 2
-            elif res == 2:
-                visited[new_droid.loc] = 4
-                print(new_droid.depth)
-                return 0
+    def on_expand(explorer, depth, frontier):
+        display.frame(display_visited, explorer.map, depth)
 
-        display_visited(visited)
-        print(droid.depth)
-        time.sleep(.1)
+    if "--depth-first" in sys.argv[1:]:
+        explorer.explore_depth_first(on_expand if display else None)
+    else:
+        explorer.explore(on_expand if display else None)
+    oxygen = explorer.find(2)[0]
+    if display:
+        display.frame(display_visited, explorer.map, last=True)
+    print(explorer.distances(explorer.start)[oxygen])
 
 
-def display_visited(visited):
-    legend = [" ", "#", ".", "X", "$"]
+def display_visited(visited, depth=None):
+    legend = {0: "#", 1: ".", 2: "$"}
     extent = [-20, -30, 30, 30]
-    print(chr(27) + "[2J")
     for col in range(extent[0], extent[2]):
-        print("".join(legend[visited.get((row, col), 0)] for row in range(extent[1], extent[3])))
+        print("".join(legend.get(visited.get((row, col)), " ") for row in range(extent[1], extent[3])))
+    if depth is not None:
+        print(depth)
 
 
 main()
@@ -4,8 +4,8 @@
 # If all else fails. Go back the way we came
 
 from collections import deque
-import time
 from intcode import IntCodeComputer, ProgramState
+from display import create_display
 
 
 # IntCode move code re direction
@@ -42,9 +42,8 @@ class Droid:
     def move(self):
         self.heading = self.get_next_heading()
         self.computer.set_input_buffer([self.heading])
-        while len(self.computer.output_buffer) == 0:
-            self.computer.step()
-        res = self.computer.output_buffer.pop()
+        self.computer.run_until_output()
+        res = self.computer.output_buffer.popleft()
 
         if res != 0:
             self.loc = new_loc(self.loc, self.heading)
@@ -89,12 +88,10 @@ class Droid:
             0: " "
         }
         extent = [-20, -30, 30, 30]
-        print(chr(27) + "[2J")
         print(f"h={self.heading}")
         for col in range(extent[0], extent[2]):
             print("".join("*" if (row, col) == self.loc else legend[min(self.grid_map.get((row, col), 0), 1)]
                           for row in range(extent[1], extent[3])))
-        time.sleep(.1)
 
 
 def main():
@@ -102,11 +99,15 @@ def main():
         core = [int(c) for c in f.readline().strip().split(",")]
 
     droid = Droid(core, loc=(0, 0))
+    display = create_display(fps=10)
     for n in range(10000):
         r = droid.move()
-        droid.display_map()
+        if display:
+            display.frame(droid.display_map, last=r == 2)
         if r == 2:
             break
+    if not display:
+        print(f"moves={n + 1} oxygen={droid.loc if r == 2 else None}")
 
 
 def print_ship_map(ship_map, droid):
@@ -117,12 +118,10 @@ def print_ship_map(ship_map, droid):
     #     max(p[1] for p in ship_map.keys())
     # ]
     extent = [-20, -40, 20, 40]
-    print(chr(27) + "[2J")
     print(f"h={droid.heading}")
     for col in range(extent[0], extent[2]):
         print("".join("*" if (row, col) == droid.loc else ("." if (row, col) in ship_map else "#")
                       for row in range(extent[1], extent[3])))
-    time.sleep(.1)
 
 
 main()
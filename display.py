@@ -0,0 +1,30 @@
+# Terminal rendering for the drivers that animate what they are doing
+#
+# A driver hands every new state to a Display, which draws it at most fps times a second
+# and drops the frames in between. Nothing sleeps, so a run takes as long as its work
+# does. Started with --headless a driver has no Display and draws nothing at all.
+
+import sys
+import time
+
+
+class Display:
+    def __init__(self, fps=20):
+        self.fps = fps
+        self._last = None
+
+    def frame(self, draw, *args, last=False, clear=True):
+        # Clears the terminal and calls draw(*args) if a frame is due. The last frame of a
+        # run is always drawn. Without clear, draw is left to update what is already there
+        now = time.monotonic()
+        if not last and self._last is not None and now - self._last < 1 / self.fps:
+            return
+        self._last = now
+        if clear:
+            print(chr(27) + "[2J" + chr(27) + "[H", end="")
+        draw(*args)
+
+
+def create_display(fps=20):
+    # None when the driver was started with --headless
+    return None if "--headless" in sys.argv[1:] else Display(fps)
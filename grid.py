@@ -0,0 +1,185 @@
+# A 2-D map of small non-negative values, in place of a dict keyed by (x, y)
+#
+# The cells live in one flat bytearray, packed 1, 2, 4 or 8 bits to a cell, so a map of
+# a million cells takes a megabyte at most rather than a tuple and a dict slot per cell.
+# The origin can be anywhere: the array grows in whichever direction a write falls
+# outside it, doubling as it goes, and indices are kept relative to its corner.
+#
+# Unset cells read as the default. A cell holding the default is empty: it isn't in the
+# grid and isn't counted or iterated, though writing one still extends the bounds, which
+# are those of every cell ever written.
+#
+# The grid pays for the whole rectangle it covers, so it suits maps that fill their
+# bounds (a maze, a screen). Lines scattered over a big plane are cheaper in a dict.
+
+
+class Grid:
+    def __init__(self, bits=8, default=0):
+        if bits not in (1, 2, 4, 8):
+            raise ValueError(f"Cells can be 1, 2, 4 or 8 bits, not {bits}")
+        if not 0 <= default < 1 << bits:
+            raise ValueError(f"Default {default} doesn't fit in {bits} bits")
+        self.bits = bits
+        self.default = default
+        self._mask = (1 << bits) - 1
+        self._per_byte = 8 // bits
+        self._fill = sum(default << (k * bits) for k in range(self._per_byte))
+
+        # Grid coordinates of cell 0, the size of the array in cells and bytes per row
+        self._x0 = 0
+        self._y0 = 0
+        self._width = 0
+        self._height = 0
+        self._stride = 0
+        self._cells = bytearray()
+
+        self._count = 0
+        self._bounds = None
+
+    def copy(self):
+        new_grid = Grid(self.bits, self.default)
+        new_grid.__dict__.update(self.__dict__)
+        new_grid._cells = bytearray(self._cells)
+        new_grid._bounds = list(self._bounds) if self._bounds else None
+        return new_grid
+
+    def __getitem__(self, loc):
+        col, row = loc[0] - self._x0, loc[1] - self._y0
+        if not (0 <= col < self._width and 0 <= row < self._height):
+            return self.default
+        if self.bits == 8:
+            return self._cells[row * self._stride + col]
+        byte = self._cells[row * self._stride + col // self._per_byte]
+        return byte >> (col % self._per_byte * self.bits) & self._mask
+
+    def __setitem__(self, loc, value):
+        if not 0 <= value <= self._mask:
+            raise ValueError(f"{value} doesn't fit in a {self.bits} bit cell")
+        x, y = loc
+        col, row = x - self._x0, y - self._y0
+        if not (0 <= col < self._width and 0 <= row < self._height):
+            self._grow(x, y)
+            col, row = x - self._x0, y - self._y0
+
+        if self.bits == 8:
+            i = row * self._stride + col
+            old = self._cells[i]
+            self._cells[i] = value
+        else:
+            i = row * self._stride + col // self._per_byte
+            shift = col % self._per_byte * self.bits
+            byte = self._cells[i]
+            old = byte >> shift & self._mask
+            self._cells[i] = byte & ~(self._mask << shift) | value << shift
+
+        if old != value:
+            if old == self.default:
+                self._count += 1
+            elif value == self.default:
+                self._count -= 1
+
+        b = self._bounds
+        if b is None:
+            self._bounds = [x, y, x, y]
+        else:
+            if x < b[0]:
+                b[0] = x
+            elif x > b[2]:
+                b[2] = x
+            if y < b[1]:
+                b[1] = y
+            elif y > b[3]:
+                b[3] = y
+
+    def _grow(self, x, y):
+        # Make room for (x, y), at least doubling the array along each side that grows.
+        # The left edge only moves by whole bytes so rows copy across as they are
+        if not self._width:
+            lo_x, lo_y, hi_x, hi_y = x - 8, y - 8, x + 8, y + 8
+        else:
+            lo_x, lo_y = self._x0, self._y0
+            hi_x, hi_y = lo_x + self._width, lo_y + self._height
+            if x < lo_x:
+                lo_x = min(x, lo_x - self._width)
+            elif x >= hi_x:
+                hi_x = max(x + 1, hi_x + self._width)
+            if y < lo_y:
+                lo_y = min(y, lo_y - self._height)
+            elif y >= hi_y:
+                hi_y = max(y + 1, hi_y + self._height)
+        lo_x = self._x0 + (lo_x - self._x0) // self._per_byte * self._per_byte
+        stride = -(-(hi_x - lo_x) // self._per_byte)
+
+        cells = bytearray([self._fill]) * (stride * (hi_y - lo_y))
+        offset = (self._x0 - lo_x) // self._per_byte
+        for row in range(self._height):
+            start = (row + self._y0 - lo_y) * stride + offset
+            cells[start:start + self._stride] = self._cells[row * self._stride:(row + 1) * self._stride]
+
+        self._x0, self._y0 = lo_x, lo_y
+        self._width, self._height = stride * self._per_byte, hi_y - lo_y
+        self._stride = stride
+        self._cells = cells
+
+    def __contains__(self, loc):
+        return self[loc] != self.default
+
+    def get(self, loc, default=None):
+        value = self[loc]
+        return default if value == self.default else value
+
+    def add(self, loc):
+        # For a grid used as a set of cells
+        self[loc] = 1
+
+    def __len__(self):
+        return self._count
+
+    def bounds(self):
+        # (min x, min y, max x, max y) over every cell written, None if none has been
+        return tuple(self._bounds) if self._bounds else None
+
+    def items(self):
+        if not self._count:
+            return
+        x0, y0, x1, y1 = self._bounds
+        default = self.default
+        for y in range(y0, y1 + 1):
+            for x in range(x0, x1 + 1):
+                value = self[(x, y)]
+                if value != default:
+                    yield (x, y), value
+
+    def keys(self):
+        return (loc for loc, _ in self.items())
+
+    __iter__ = keys
+
+    def values(self):
+        return (value for _, value in self.items())
+
+    def count(self, value):
+        # How many cells hold value, counted by bytes.count when cells are bytes
+        if value == self.default:
+            return 0
+        if self.bits == 8:
+            return self._cells.count(value)
+        return sum(1 for v in self.values() if v == value)
+
+    def find(self, value):
+        # Cells holding value, in row order. Whole rows without it are skipped a byte at a
+        # time when cells are bytes
+        if self.bits == 8 and value != self.default:
+            found = []
+            i = self._cells.find(value)
+            while i != -1:
+                row, col = divmod(i, self._stride)
+                found += [(col + self._x0, row + self._y0)]
+                i = self._cells.find(value, i + 1)
+            return found
+        return [loc for loc, v in self.items() if v == value]
+
+    def neighbours(self, loc):
+        # The four cells next to loc with their values, defaults included
+        x, y = loc
+        return [((x2, y2), self[(x2, y2)]) for x2, y2 in ((x, y + 1), (x, y - 1), (x - 1, y), (x + 1, y))]
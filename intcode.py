@@ -1,19 +1,52 @@
 # This is the same int code computer as used in 009
 
+from collections import deque
 from enum import IntEnum
 from typing import List, Union
 
+from intcode_memory import MemoryModel, create_memory, changed_cells, store
+
 
 class ProgramState(IntEnum):
     waiting = 0
     running = 1
     error = 2
     halt = 3
+    awaiting_input = 4
 
 
 class ParamMode(IntEnum):
     value = 0
     reference = 1
+    relative = 2
+
+
+class OpCode(IntEnum):
+    add = 1
+    mul = 2
+    save_input = 3
+    output = 4
+    jump_if_true = 5
+    jump_if_false = 6
+    less_than = 7
+    equals = 8
+    adjust_relative_base = 9
+    halt = 99
+
+
+# Number of parameters following each opcode in the core
+param_count = {
+    OpCode.add: 3,
+    OpCode.mul: 3,
+    OpCode.save_input: 1,
+    OpCode.output: 1,
+    OpCode.jump_if_true: 2,
+    OpCode.jump_if_false: 2,
+    OpCode.less_than: 3,
+    OpCode.equals: 3,
+    OpCode.adjust_relative_base: 1,
+    OpCode.halt: 0
+}
 
 
 class Param:
@@ -28,16 +61,119 @@ class Param:
             return f"{self.data}"
 
 
+class Channel(deque):
+    # First in, first out stream of values going into or coming out of a program
+
+    def drain(self, n=None):
+        # Remove and return the oldest n values (everything by default)
+        if n is None:
+            values = list(self)
+            self.clear()
+            return values
+        return [self.popleft() for _ in range(n)]
+
+
+class Snapshot:
+    # The state of a computer as the cells that differ from the core it was loaded with,
+    # along with its registers and buffers. Only meaningful to a computer loaded with
+    # that same core
+    def __init__(self, changes, size, program_counter, relative_base, state, input_buffer,
+                 output_buffer):
+        self.changes = changes
+        self.size = size
+        self.program_counter = program_counter
+        self.relative_base = relative_base
+        self.state = state
+        self.input_buffer = input_buffer
+        self.output_buffer = output_buffer
+
+
+class Trace:
+    # The most recent instructions run in debug mode, kept as (pc, opcode, params, values)
+    # records in a ring buffer of fixed size. Records are only turned into log lines when
+    # someone asks for them
+    def __init__(self, size=100000):
+        self.records = deque(maxlen=size)
+        self.stopped = False
+        self._stop_pc = None
+        self._remaining = None
+        self._after = 0
+
+    def stop_at(self, pc, after=0):
+        # Stop recording once the instruction at pc has run, followed by after more, so the
+        # trace ends up holding what led up to it
+        self.stopped = False
+        self._stop_pc = pc
+        self._remaining = None
+        self._after = after
+
+    def record(self, pc, opcode, params, values):
+        if self.stopped:
+            return
+        self.records.append((pc, opcode, params, values))
+
+        if self._remaining is None:
+            if pc != self._stop_pc:
+                return
+            self._remaining = self._after
+        if self._remaining == 0:
+            self.stopped = True
+        self._remaining -= 1
+
+    def clear(self):
+        self.records.clear()
+
+    def lines(self):
+        return [format_record(*record) for record in self.records]
+
+
+def format_record(pc, opcode, params, values):
+    if opcode == OpCode.add or opcode == OpCode.mul:
+        (i, j, k), (a, b, v) = params, values
+        name = "ADD" if opcode == OpCode.add else "MUL"
+        return f"[{pc:#4}] {name} {i.print(a)}, {j.print(b)} = {v} => [{k.data}]"
+    if opcode == OpCode.less_than or opcode == OpCode.equals:
+        (i, j, k), (a, b, v) = params, values
+        name = "LT" if opcode == OpCode.less_than else "EQ"
+        return f"[{pc:#4}] {name} {i.print(a)}, {j.print(b)} : {v} => [{k.data}]"
+    if opcode == OpCode.save_input:
+        return f"[{pc:#4}] INP {values[0]} -> [{params[0].data}]"
+    if opcode == OpCode.output:
+        return f"[{pc:#4}] OUT {params[0].print(values[0])}"
+    if opcode == OpCode.jump_if_true or opcode == OpCode.jump_if_false:
+        (a, b), (val_a, val_b) = params, values
+        name = "JMP TRUE" if opcode == OpCode.jump_if_true else "JMP FALSE"
+        target = "NOJMP" if val_b is None else b.print(val_b)
+        return f"[{pc:#4}] {name} {a.print(val_a)} -> {target}"
+    if opcode == OpCode.adjust_relative_base:
+        return f"[{pc:#4}] RELBASE {params[0].print(values[0])} -> {values[1]}"
+    return f"[{pc:#4}] HLT"
+
+
 class IntCodeComputer:
-    def __init__(self, debug=False):
-        self._core = []
+    def __init__(self, debug=False, fast=False, memory=MemoryModel.flat, trace_size=100000):
+        self._memory = memory
+        self._core = create_memory(memory, [])
+        self._image = ()
         self.program_counter: int = 0
         self.relative_base: int = 0
         self.state = ProgramState.waiting
-        self.input_buffer: List[int] = []
-        self.output_buffer: List[int] = []
+        self.input_buffer = Channel()
+        self.output_buffer = Channel()
         self._debug = debug
-        self._log = []
+        self._fast = fast
+        self.trace = Trace(trace_size)
+
+        # Callbacks keyed by address, see watch()
+        self._read_watches = {}
+        self._write_watches = {}
+        # A clone starts out sharing its parent's watches and decoded instructions. Whichever
+        # side changes them first takes its own copy
+        self._watches_shared = False
+
+        # Decoded instructions keyed by program counter. Any write to a cell in
+        # _decoded_cells may have modified a cached instruction
+        self._clear_decode_cache()
 
         self.opcodes = {
             1: self._add,
@@ -53,63 +189,339 @@ class IntCodeComputer:
         }
 
     def load_core(self, core):
-        self._core = core.copy()
+        self._core = create_memory(self._memory, core)
+        self._image = tuple(core)
+        self._clear_decode_cache()
         self._reset()
 
     def clone(self):
-        new_computer = IntCodeComputer()
-        new_computer.load_core(self._core)
+        new_computer = type(self)(fast=self._fast, memory=self._memory)
+        new_computer._core = create_memory(self._memory, self._core)
+        new_computer._image = self._image
         new_computer.program_counter = self.program_counter
         new_computer.relative_base = self.relative_base
         new_computer.state = self.state
+        new_computer._decode_cache = self._decode_cache
+        new_computer._decoded_cells = self._decoded_cells
+        new_computer._read_watches = self._read_watches
+        new_computer._write_watches = self._write_watches
+        self._decode_shared = new_computer._decode_shared = True
+        self._watches_shared = new_computer._watches_shared = True
         return new_computer
 
+    def snapshot(self):
+        core = self._core
+        return Snapshot(changed_cells(core, self._image), len(core), self.program_counter, self.relative_base, self.state,
+                        list(self.input_buffer), list(self.output_buffer))
+
+    def restore(self, snapshot: Snapshot):
+        self._core = create_memory(self._memory, self._image)
+        if snapshot.size > len(self._core):
+            self._store(snapshot.size - 1, 0)
+        for i, v in snapshot.changes.items():
+            self._store(i, v)
+
+        self._clear_decode_cache()
+        self.program_counter = snapshot.program_counter
+        self.relative_base = snapshot.relative_base
+        self.state = snapshot.state
+        self.input_buffer = Channel(snapshot.input_buffer)
+        self.output_buffer = Channel(snapshot.output_buffer)
+
     def _reset(self):
         self.program_counter = 0
         self.relative_base = 0
         self.state = ProgramState.waiting
-        self.input_buffer = []
-        self.output_buffer = []
+        self.input_buffer = Channel()
+        self.output_buffer = Channel()
 
     def set_noun_verb(self, noun, verb):
         self.write_value(1, noun)
         self.write_value(2, verb)
 
+    def watch(self, addresses, on_read=None, on_write=None):
+        # Calls on_read(computer, address, value) whenever an instruction reads one of the
+        # addresses (an address or a range of them), and on_write(computer, address, value)
+        # after an instruction or write_value() writes one. Reads of instructions themselves
+        # don't count
+        if isinstance(addresses, int):
+            addresses = [addresses]
+        if self._watches_shared:
+            self._own_watches()
+        for i in addresses:
+            if on_read is not None:
+                self._read_watches.setdefault(i, []).append(on_read)
+            if on_write is not None:
+                self._write_watches.setdefault(i, []).append(on_write)
+
+    def unwatch(self, addresses):
+        if isinstance(addresses, int):
+            addresses = [addresses]
+        if self._watches_shared:
+            self._own_watches()
+        for i in addresses:
+            self._read_watches.pop(i, None)
+            self._write_watches.pop(i, None)
+
+    def _own_watches(self):
+        self._read_watches = {i: callbacks.copy() for i, callbacks in self._read_watches.items()}
+        self._write_watches = {i: callbacks.copy() for i, callbacks in self._write_watches.items()}
+        self._watches_shared = False
+
     def set_input_buffer(self, input_buffer):
+        if not isinstance(input_buffer, Channel):
+            input_buffer = Channel(input_buffer)
         self.input_buffer = input_buffer
 
     def run(self):
+        # Runs until the program halts, fails or needs input that isn't in the input buffer
+        self._run()
+
+    def run_until_input_needed(self):
+        self._run()
+
+    def run_until_output(self, n=1):
+        # As run(), but also pauses (still in the running state) as soon as there are n
+        # values in the output buffer
+        self._run(n)
+
+    def _run(self, output_count=None):
+        if self._fast and not self._debug and not self._read_watches:
+            self.run_fast(output_count)
+            return
+
         self.state = ProgramState.running
-        while self.state == ProgramState.running:
-            self.step()
+        if output_count is None:
+            while self.state == ProgramState.running:
+                self.step()
+        else:
+            while self.state == ProgramState.running and len(self.output_buffer) < output_count:
+                self.step()
+
+    def run_fast(self, output_count=None):
+        # Same state transitions and buffers as run(), but the whole program runs in this one
+        # loop with the machine state held in locals and operands resolved inline. Nothing is
+        # logged, and read watches aren't supported. Instructions that run off the end of the
+        # core are handed over to step()
+        self.state = ProgramState.running
+        if output_count is not None and len(self.output_buffer) >= output_count:
+            return
+
+        core = self._core
+        size = len(core)
+        pc = self.program_counter
+        rb = self.relative_base
+        input_buffer = self.input_buffer
+        output_buffer = self.output_buffer
+        write_watches = self._write_watches
+        # Whether the loop has written to the core since the decode cache was last cleared
+        written = False
+
+        try:
+            while True:
+                if pc + 4 > size:
+                    if written:
+                        # step() would run instructions decoded before those writes
+                        self._clear_decode_cache()
+                        written = False
+                    self.program_counter, self.relative_base = pc, rb
+                    self.step()
+                    core = self._core
+                    size = len(core)
+                    pc, rb = self.program_counter, self.relative_base
+                    if self.state != ProgramState.running:
+                        break
+                    if output_count is not None and len(output_buffer) >= output_count:
+                        break
+                    continue
+
+                raw = core[pc]
+                op = raw % 100
+
+                if op == 99:
+                    self.state = ProgramState.halt
+                    break
+                if op not in param_count:
+                    self.state = ProgramState.error
+                    break
+
+                a = core[pc + 1]
+                m = raw // 100 % 10
+                if m > 2:
+                    self.state = ProgramState.error
+                    break
+                if op == 3:
+                    if not input_buffer:
+                        self.state = ProgramState.awaiting_input
+                        break
+                    if m == 2:
+                        a += rb
+                    elif m == 1:
+                        raise RuntimeError("Write attempted in immediate mode!")
+                    k, v, n = a, input_buffer.popleft(), 2
+                else:
+                    if m == 0:
+                        a = core[a] if a < size else 0
+                    elif m == 2:
+                        a += rb
+                        a = core[a] if a < size else 0
+
+                    if op == 4:
+                        output_buffer.append(a)
+                        pc += 2
+                        if output_count is not None and len(output_buffer) >= output_count:
+                            break
+                        continue
+                    if op == 9:
+                        rb += a
+                        pc += 2
+                        continue
+
+                    b = core[pc + 2]
+                    m = raw // 1000 % 10
+                    if m > 2:
+                        self.state = ProgramState.error
+                        break
+
+                    if op == 5 or op == 6:
+                        # The target is only read when the jump is taken
+                        taken = a != 0 if op == 5 else a == 0
+                        if not taken:
+                            pc += 3
+                            continue
+                        if m == 0:
+                            b = core[b] if b < size else 0
+                        elif m == 2:
+                            b += rb
+                            b = core[b] if b < size else 0
+                        pc = b
+                        continue
+
+                    if m == 0:
+                        b = core[b] if b < size else 0
+                    elif m == 2:
+                        b += rb
+                        b = core[b] if b < size else 0
+
+                    k = core[pc + 3]
+                    m = raw // 10000 % 10
+                    if m > 2:
+                        self.state = ProgramState.error
+                        break
+
+                    if op == 1:
+                        v = a + b
+                    elif op == 2:
+                        v = a * b
+                    elif op == 7:
+                        v = 1 if a < b else 0
+                    else:
+                        v = 1 if a == b else 0
+
+                    if m == 2:
+                        k += rb
+                    elif m == 1:
+                        raise RuntimeError("Write attempted in immediate mode!")
+                    n = 4
+
+                try:
+                    if k >= size:
+                        store(core, k, v)
+                        size = len(core)
+                    else:
+                        core[k] = v
+                except OverflowError:
+                    core = self._promote_core()
+                    store(core, k, v)
+                    size = len(core)
+                written = True
+                if k in write_watches:
+                    # The callbacks see the computer as it is at this instruction and may change it
+                    self.program_counter, self.relative_base = pc, rb
+                    self._fire(write_watches, k, v)
+                    core = self._core
+                    size = len(core)
+                    pc, rb = self.program_counter, self.relative_base
+                    if self.state != ProgramState.running:
+                        pc += n
+                        break
+                pc += n
+        finally:
+            self.program_counter, self.relative_base = pc, rb
+            # Writes above bypass write_value, so nothing decoded earlier can be trusted
+            self._clear_decode_cache()
 
     def step(self):
         if self.program_counter >= len(self._core):
             self.state = ProgramState.error
 
-        _raw_opcode = self.read_value(self.program_counter)
+        instruction = self._decode_cache.get(self.program_counter)
+        if instruction is None:
+            instruction = self._decode(self.program_counter)
+            if instruction is None:
+                self.state = ProgramState.error
+                return
+
+        handler, params, relative = instruction
+        if relative:
+            params = [Param(self.relative_base + p.data, mode=ParamMode.reference)
+                      if p.mode == ParamMode.relative else p
+                      for p in params]
+        handler(self, params)
+
+    def _decode(self, pc):
+        _raw_opcode = self.read_value(pc)
         _opcode = _raw_opcode % 100
         mode = _raw_opcode // 100
 
         opcode = self.opcodes.get(_opcode)
         if opcode is None:
-            self.state = ProgramState.error
-            return
-
-        opcode(mode)
+            return None
+
+        # Cache the plain function rather than the bound method so clones can share entries
+        n = param_count[_opcode]
+        params = self._extract_params(pc, n, mode)
+        if None in params:
+            # A mode digit that isn't 0, 1 or 2
+            return None
+        instruction = (opcode.__func__, params, any(p.mode == ParamMode.relative for p in params))
+        if self._decode_shared:
+            self._own_decode_cache()
+        self._decode_cache[pc] = instruction
+        self._decoded_cells.update(range(pc, pc + n + 1))
+        return instruction
+
+    def _clear_decode_cache(self):
+        self._decode_cache = {}
+        self._decoded_cells = set()
+        self._decode_shared = False
+
+    def _own_decode_cache(self):
+        self._decode_cache = self._decode_cache.copy()
+        self._decoded_cells = self._decoded_cells.copy()
+        self._decode_shared = False
+
+    def _invalidate_decoded(self, i):
+        # Instructions are at most 4 cells long. The cell stays in _decoded_cells
+        # since an overlapping instruction may still cover it
+        for pc in range(i - 3, i + 1):
+            instruction = self._decode_cache.get(pc)
+            if instruction is not None and pc + len(instruction[1]) >= i:
+                if self._decode_shared:
+                    self._own_decode_cache()
+                del self._decode_cache[pc]
 
     def peek(self, i):
         return self.read_value(i)
 
     def get_log(self):
-        return self._log
+        return self.trace.lines()
 
     def __str__(self):
         return str(f"[pc={self.program_counter}, st={self.state}] {self._core}")
 
-    def _extract_params(self, n, mode):
-        idx = [self.read_value(i)
-               for i in range(self.program_counter + 1, self.program_counter + n + 1)]
+    def _extract_params(self, pc, n, mode):
+        idx = [self.read_value(i) for i in range(pc + 1, pc + n + 1)]
         params: List[Param] = [None] * n
         for i in range(n):
             if mode % 10 == 0:
@@ -117,7 +529,7 @@ class IntCodeComputer:
             elif mode % 10 == 1:
                 params[i] = Param(idx[i], mode=ParamMode.value)
             elif mode % 10 == 2:
-                params[i] = Param(self.relative_base + idx[i], mode=ParamMode.reference)
+                params[i] = Param(idx[i], mode=ParamMode.relative)
             mode //= 10
         return params
 
@@ -129,9 +541,26 @@ class IntCodeComputer:
         else:
             i = p
 
-        if i >= len(self._core):
-            self._core.extend(0 for _ in range(i + 1 - len(self._core)))
-        self._core[i] = v
+        self._store(i, v)
+        if i in self._decoded_cells:
+            self._invalidate_decoded(i)
+        if i in self._write_watches:
+            self._fire(self._write_watches, i, v)
+
+    def _fire(self, watches, i, v):
+        for callback in watches[i]:
+            callback(self, i, v)
+
+    def _store(self, i, v):
+        try:
+            store(self._core, i, v)
+        except OverflowError:
+            store(self._promote_core(), i, v)
+
+    def _promote_core(self):
+        # A compact core can't hold a value this big. Carry on with a plain list
+        self._core = list(self._core)
+        return self._core
 
     def read_value(self, p: Union[int, Param]):
         i = None
@@ -140,6 +569,10 @@ class IntCodeComputer:
                 return p.data
             elif p.mode == ParamMode.reference:
                 i = p.data
+            if i in self._read_watches:
+                v = self._core[i] if i < len(self._core) else 0
+                self._fire(self._read_watches, i, v)
+                return v
         else:
             i = p
 
@@ -147,97 +580,96 @@ class IntCodeComputer:
             return 0
         return self._core[i]
 
-    def _add(self, mode):
-        i, j, k = self._extract_params(3, mode)
+    def _add(self, params):
+        i, j, k = params
         a, b = self.read_value(i), self.read_value(j)
         self.write_value(k, a + b)
         if self._debug:
-            self._log += [f"[{self.program_counter:#4}] ADD {i.print(a)}, {j.print(b)} = {a + b} => [{k.data}]"]
+            self.trace.record(self.program_counter, OpCode.add, params, (a, b, a + b))
         self.program_counter += 4
 
-    def _mul(self, mode):
-        i, j, k = self._extract_params(3, mode)
+    def _mul(self, params):
+        i, j, k = params
         a, b = self.read_value(i), self.read_value(j)
         self.write_value(k, a * b)
         if self._debug:
-            self._log += [f"[{self.program_counter:#4}] MUL {i.print(a)}, {j.print(b)} = {a * b} => [{k.data}]"]
+            self.trace.record(self.program_counter, OpCode.mul, params, (a, b, a * b))
         self.program_counter += 4
 
-    def _save_input(self, mode):
-        k, = self._extract_params(1, mode)
-        val = self.input_buffer.pop()
+    def _save_input(self, params):
+        # With nothing to read we suspend on this instruction until input is supplied
+        if not self.input_buffer:
+            self.state = ProgramState.awaiting_input
+            return
+        if self.state == ProgramState.awaiting_input:
+            self.state = ProgramState.running
+
+        k, = params
+        val = self.input_buffer.popleft()
         self.write_value(k, val)
         if self._debug:
-            self._log += [f"[{self.program_counter:#4}] INP {val} -> [{k.data}]"]
+            self.trace.record(self.program_counter, OpCode.save_input, params, (val,))
         self.program_counter += 2
 
-    def _output(self, mode):
-        k, = self._extract_params(1, mode)
+    def _output(self, params):
+        k, = params
         val = self.read_value(k)
-        self.output_buffer += [val]
+        self.output_buffer.append(val)
         if self._debug:
-            self._log += [f"[{self.program_counter:#4}] OUT {k.print(val)}"]
+            self.trace.record(self.program_counter, OpCode.output, params, (val,))
         self.program_counter += 2
 
-    def _jump_if_true(self, mode):
-        a, b = self._extract_params(2, mode)
+    def _jump_if_true(self, params):
+        a, b = params
         val_a = self.read_value(a)
+        val_b = self.read_value(b) if val_a else None
         if self._debug:
-            self._log += [f"[{self.program_counter:#4}] JMP TRUE {a.print(val_a)}"]
+            self.trace.record(self.program_counter, OpCode.jump_if_true, params, (val_a, val_b))
 
         if val_a:
-            val_b = self.read_value(b)
             self.program_counter = val_b
-            if self._debug:
-                self._log[-1] += f" -> {b.print(val_b)}"
         else:
             self.program_counter += 3
-            if self._debug:
-                self._log[-1] += f" -> NOJMP"
 
-    def _jump_if_false(self, mode):
-        a, b = self._extract_params(2, mode)
+    def _jump_if_false(self, params):
+        a, b = params
         val_a = self.read_value(a)
+        val_b = self.read_value(b) if not val_a else None
         if self._debug:
-            self._log += [f"[{self.program_counter:#4}] JMP FALSE {a.print(val_a)}"]
+            self.trace.record(self.program_counter, OpCode.jump_if_false, params, (val_a, val_b))
 
         if not val_a:
-            val_b = self.read_value(b)
             self.program_counter = val_b
-            if self._debug:
-                self._log[-1] += f" -> {b.print(val_b)}"
         else:
             self.program_counter += 3
-            if self._debug:
-                self._log[-1] += f" -> NOJMP"
 
-    def _less_than(self, mode):
-        i, j, k = self._extract_params(3, mode)
+    def _less_than(self, params):
+        i, j, k = params
         a, b = self.read_value(i), self.read_value(j)
         val = 1 if a < b else 0
         self.write_value(k, val)
         if self._debug:
-            self._log += [f"[{self.program_counter:#4}] LT {i.print(a)}, {j.print(b)} : {val} => [{k.data}]"]
+            self.trace.record(self.program_counter, OpCode.less_than, params, (a, b, val))
         self.program_counter += 4
 
-    def _equals(self, mode):
-        i, j, k = self._extract_params(3, mode)
+    def _equals(self, params):
+        i, j, k = params
         a, b = self.read_value(i), self.read_value(j)
         val = 1 if a == b else 0
         self.write_value(k, val)
         if self._debug:
-            self._log += [f"[{self.program_counter:#4}] EQ {i.print(a)}, {j.print(b)} : {val} => [{k.data}]"]
+            self.trace.record(self.program_counter, OpCode.equals, params, (a, b, val))
         self.program_counter += 4
 
-    def _adjust_relative_base(self, mode):
-        k, = self._extract_params(1, mode)
+    def _adjust_relative_base(self, params):
+        k, = params
         val = self.read_value(k)
         self.relative_base += val
         if self._debug:
-            self._log += [f"[{self.program_counter:#4}] RELBASE {k.print(val)} -> {self.relative_base}"]
+            self.trace.record(self.program_counter, OpCode.adjust_relative_base, params, (val, self.relative_base))
         self.program_counter += 2
 
-    def _halt(self, mode):
+    def _halt(self, params):
         self.state = ProgramState.halt
         if self._debug:
-            self._log += [f"[{self.program_counter:#4}] HLT"]
+            self.trace.record(self.program_counter, OpCode.halt, params, ())
@@ -0,0 +1,55 @@
+# An int code computer for asyncio
+#
+# Input comes from one asyncio.Queue and output goes to another, so many programs and
+# whatever drives them (a robot controller, a game, a socket) can share one event loop.
+# The instructions themselves still run on the plain input and output buffers: the
+# computer runs batch_size instructions at a time, passes its output on and yields to
+# the event loop in between, and when it needs input that hasn't arrived it awaits the
+# input queue instead of stopping. With fast, each stretch between awaits runs in
+# run_fast() and lasts until the next output or input instead of batch_size
+# instructions, so a long stretch without either doesn't yield.
+
+import asyncio
+
+from intcode import IntCodeComputer, ProgramState
+from intcode_memory import MemoryModel
+
+
+class AsyncIntCodeComputer(IntCodeComputer):
+    def __init__(self, debug=False, fast=False, memory=MemoryModel.flat, batch_size=1000,
+                 input_queue=None, output_queue=None):
+        super().__init__(debug=debug, fast=fast, memory=memory)
+        self.batch_size = batch_size
+        self.input_queue = asyncio.Queue() if input_queue is None else input_queue
+        self.output_queue = asyncio.Queue() if output_queue is None else output_queue
+
+    def clone(self):
+        # The clone gets queues of its own, sharing them would split the values between two programs
+        new_computer = super().clone()
+        new_computer.batch_size = self.batch_size
+        return new_computer
+
+    async def run_async(self):
+        # Runs until the program halts or fails and returns the final state
+        self.state = ProgramState.running
+        while True:
+            if self._fast and not self._debug and not self._read_watches:
+                self.run_fast(len(self.output_buffer) + 1)
+            else:
+                for _ in range(self.batch_size):
+                    self.step()
+                    if self.state != ProgramState.running:
+                        break
+
+            while self.output_buffer:
+                await self.output_queue.put(self.output_buffer.popleft())
+
+            if self.state == ProgramState.awaiting_input:
+                self.input_buffer.append(await self.input_queue.get())
+                while not self.input_queue.empty():
+                    self.input_buffer.append(self.input_queue.get_nowait())
+                self.state = ProgramState.running
+            elif self.state != ProgramState.running:
+                return self.state
+            else:
+                await asyncio.sleep(0)
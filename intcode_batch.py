@@ -0,0 +1,309 @@
+# Many copies of one program run in lock step with NumPy
+#
+# Brute force searches (day 2's noun/verb sweep, day 7's phase settings) run the same
+# program thousands of times with different inputs. Here every copy is a lane: a row of
+# a 2-D array of cores with its own program counter, relative base and state. Each step
+# gathers the current instruction of every running lane, groups the lanes by opcode and
+# carries out each group as one masked vector operation, so a sweep costs one pass over
+# the program rather than one interpreter run per input.
+#
+# Lanes don't have to stay together. Each one reads its instruction from its own row, so
+# lanes that branch differently just end up in different groups. A lane is retired as
+# soon as it halts, fails or needs input it hasn't been given, and the remaining lanes
+# carry on without it.
+#
+# Cells are 64 bit. A lane whose arithmetic would overflow them is retired in the error
+# state with its overflow flag set, and computer() rebuilds it on the ordinary
+# interpreter if it needs finishing.
+
+import numpy as np
+
+from intcode import IntCodeComputer, ProgramState, OpCode, param_count
+
+
+class BatchIntCodeComputer:
+    def __init__(self, core, n):
+        self.n = n
+        self._image = list(core)
+        # Four cells of slack so every lane can always fetch a whole instruction
+        self.cores = np.zeros((n, len(core) + 4), dtype=np.int64)
+        self.cores[:, :len(core)] = core
+        self.program_counter = np.zeros(n, dtype=np.int64)
+        self.relative_base = np.zeros(n, dtype=np.int64)
+        self.state = np.full(n, ProgramState.waiting, dtype=np.int8)
+        self.overflow = np.zeros(n, dtype=bool)
+        self.inputs = np.zeros((n, 0), dtype=np.int64)
+        self.input_count = np.zeros(n, dtype=np.int64)
+        self.outputs = np.zeros((n, 0), dtype=np.int64)
+        self.output_count = np.zeros(n, dtype=np.int64)
+
+        # Cells set per lane before running, so computer() can rebuild a lane
+        self._patches = {}
+
+    def write_values(self, i, values):
+        # Sets cell i of every lane, values holding one value per lane
+        values = np.broadcast_to(np.asarray(values, dtype=np.int64), (self.n,))
+        self._grow(i + 1)
+        self.cores[:, i] = values
+        self._patches[i] = values.copy()
+
+    def set_noun_verb(self, nouns, verbs):
+        self.write_values(1, nouns)
+        self.write_values(2, verbs)
+
+    def feed(self, values):
+        # Gives every lane one more input value and wakes the lanes waiting for one
+        values = np.broadcast_to(np.asarray(values, dtype=np.int64), (self.n,))
+        self.inputs = np.column_stack([self.inputs, values])
+        waiting = self.state == ProgramState.awaiting_input
+        self.state[waiting] = ProgramState.running
+
+    def peek(self, i):
+        # Cell i of every lane
+        if i >= self.cores.shape[1]:
+            return np.zeros(self.n, dtype=np.int64)
+        return self.cores[:, i].copy()
+
+    def output(self, k=-1):
+        # The k-th output of every lane (the latest by default), 0 for lanes without one
+        if k < 0:
+            k = self.output_count - 1
+        else:
+            k = np.full(self.n, k)
+        found = (k >= 0) & (k < self.output_count)
+        values = np.zeros(self.n, dtype=np.int64)
+        values[found] = self.outputs[np.nonzero(found)[0], k[found]]
+        return values
+
+    def computer(self, lane):
+        # An ordinary computer set up the way the lane started out, with the input it has
+        # been given, to finish off lanes that couldn't be run here
+        computer = IntCodeComputer()
+        computer.load_core(self._image)
+        for i, values in self._patches.items():
+            computer.write_value(i, int(values[lane]))
+        computer.set_input_buffer([int(v) for v in self.inputs[lane]])
+        return computer
+
+    def run(self, max_steps=None):
+        # Runs every lane that isn't halted, failed or waiting for input. With max_steps
+        # the lanes still going after that many steps are left running
+        self.state[self.state == ProgramState.waiting] = ProgramState.running
+        lanes = np.nonzero(self.state == ProgramState.running)[0]
+
+        steps = 0
+        while lanes.size and (max_steps is None or steps < max_steps):
+            self._grow(int(self.program_counter[lanes].max()) + 4)
+            pc = self.program_counter[lanes]
+            raw = self.cores[lanes, pc]
+            op = raw % 100
+
+            for _opcode in np.unique(op):
+                selected = op == _opcode
+                group = _handlers.get(int(_opcode))
+                if group is None:
+                    self.state[lanes[selected]] = ProgramState.error
+                    continue
+                group(self, lanes[selected], pc[selected], raw[selected])
+
+            lanes = lanes[self.state[lanes] == ProgramState.running]
+            steps += 1
+
+    def _grow(self, width):
+        if width > self.cores.shape[1]:
+            new_width = max(width, 2 * self.cores.shape[1])
+            self.cores = np.pad(self.cores, ((0, 0), (0, new_width - self.cores.shape[1])))
+
+    def _fail(self, lanes, failed):
+        # Moves the failed lanes to the error state and returns the ones left
+        if failed.any():
+            self.state[lanes[failed]] = ProgramState.error
+            return ~failed
+        return None
+
+    def _operand(self, lanes, pc, raw, i):
+        # Values of parameter i for each lane, and which lanes couldn't read it
+        arg = self.cores[lanes, pc + i]
+        mode = raw // _mode_divisor[i] % 10
+        address = np.where(mode == 2, arg + self.relative_base[lanes], arg)
+        width = self.cores.shape[1]
+        in_core = (address >= 0) & (address < width)
+        value = np.where(in_core, self.cores[lanes, np.clip(address, 0, width - 1)], 0)
+        value = np.where(mode == 1, arg, value)
+        failed = (mode > 2) | ((mode != 1) & (address < 0))
+        return value, failed
+
+    def _address(self, lanes, pc, raw, i):
+        # Addresses written by parameter i for each lane, and which lanes can't write there
+        arg = self.cores[lanes, pc + i]
+        mode = raw // _mode_divisor[i] % 10
+        address = np.where(mode == 2, arg + self.relative_base[lanes], arg)
+        failed = (mode == 1) | (mode > 2) | (address < 0)
+        return address, failed
+
+    def _write(self, lanes, address, values):
+        if lanes.size:
+            self._grow(int(address.max()) + 1)
+            self.cores[lanes, address] = values
+
+    def _arithmetic(self, lanes, pc, raw):
+        a, failed_a = self._operand(lanes, pc, raw, 1)
+        b, failed_b = self._operand(lanes, pc, raw, 2)
+        address, failed_k = self._address(lanes, pc, raw, 3)
+        failed = failed_a | failed_b | failed_k
+
+        _opcode = raw[0] % 100
+        if _opcode == OpCode.add:
+            with np.errstate(over="ignore"):
+                values = a + b
+            overflow = ((a ^ values) & (b ^ values)) < 0
+        elif _opcode == OpCode.mul:
+            with np.errstate(over="ignore"):
+                values = a * b
+                # A product that wrapped can't be divided back into a, except -2**63 * -1
+                # which wraps to itself
+                divisor = np.where(b == 0, 1, b)
+                overflow = (values // divisor != a) & (b != 0)
+            overflow |= (a == _int64_min) & (b == -1)
+        elif _opcode == OpCode.less_than:
+            values = (a < b).astype(np.int64)
+            overflow = None
+        else:
+            values = (a == b).astype(np.int64)
+            overflow = None
+
+        if overflow is not None and overflow.any():
+            self.overflow[lanes[overflow]] = True
+            failed |= overflow
+
+        keep = self._fail(lanes, failed)
+        if keep is not None:
+            lanes, pc, address, values = lanes[keep], pc[keep], address[keep], values[keep]
+        self._write(lanes, address, values)
+        self.program_counter[lanes] = pc + 4
+
+    def _save_input(self, lanes, pc, raw):
+        address, failed = self._address(lanes, pc, raw, 1)
+        keep = self._fail(lanes, failed)
+        if keep is not None:
+            lanes, pc, address = lanes[keep], pc[keep], address[keep]
+
+        # Lanes that have read all their input wait on this instruction for more
+        empty = self.input_count[lanes] >= self.inputs.shape[1]
+        if empty.any():
+            self.state[lanes[empty]] = ProgramState.awaiting_input
+            lanes, pc, address = lanes[~empty], pc[~empty], address[~empty]
+
+        self._write(lanes, address, self.inputs[lanes, self.input_count[lanes]])
+        self.input_count[lanes] += 1
+        self.program_counter[lanes] = pc + 2
+
+    def _output(self, lanes, pc, raw):
+        values, failed = self._operand(lanes, pc, raw, 1)
+        keep = self._fail(lanes, failed)
+        if keep is not None:
+            lanes, pc, values = lanes[keep], pc[keep], values[keep]
+
+        if lanes.size and int(self.output_count[lanes].max()) >= self.outputs.shape[1]:
+            self.outputs = np.pad(self.outputs, ((0, 0), (0, max(1, self.outputs.shape[1]))))
+        self.outputs[lanes, self.output_count[lanes]] = values
+        self.output_count[lanes] += 1
+        self.program_counter[lanes] = pc + 2
+
+    def _jump(self, lanes, pc, raw):
+        a, failed_a = self._operand(lanes, pc, raw, 1)
+        b, failed_b = self._operand(lanes, pc, raw, 2)
+        taken = a != 0 if raw[0] % 100 == OpCode.jump_if_true else a == 0
+        # The target is only read when the jump is taken
+        keep = self._fail(lanes, failed_a | (failed_b & taken))
+        if keep is not None:
+            lanes, pc, b, taken = lanes[keep], pc[keep], b[keep], taken[keep]
+        self.program_counter[lanes] = np.where(taken, b, pc + 3)
+
+    def _adjust_relative_base(self, lanes, pc, raw):
+        a, failed = self._operand(lanes, pc, raw, 1)
+        keep = self._fail(lanes, failed)
+        if keep is not None:
+            lanes, pc, a = lanes[keep], pc[keep], a[keep]
+        self.relative_base[lanes] += a
+        self.program_counter[lanes] = pc + 2
+
+    def _halt(self, lanes, pc, raw):
+        self.state[lanes] = ProgramState.halt
+
+
+# Divides a raw opcode down to the mode digit of each parameter
+_mode_divisor = [None, 100, 1000, 10000]
+_int64_min = np.iinfo(np.int64).min
+
+_handlers = {
+    OpCode.add: BatchIntCodeComputer._arithmetic,
+    OpCode.mul: BatchIntCodeComputer._arithmetic,
+    OpCode.save_input: BatchIntCodeComputer._save_input,
+    OpCode.output: BatchIntCodeComputer._output,
+    OpCode.jump_if_true: BatchIntCodeComputer._jump,
+    OpCode.jump_if_false: BatchIntCodeComputer._jump,
+    OpCode.less_than: BatchIntCodeComputer._arithmetic,
+    OpCode.equals: BatchIntCodeComputer._arithmetic,
+    OpCode.adjust_relative_base: BatchIntCodeComputer._adjust_relative_base,
+    OpCode.halt: BatchIntCodeComputer._halt
+}
+
+
+def test_against_interpreter(n_programs=1000, n_lanes=4, max_steps=200, seed=0):
+    # Runs random programs on both engines and compares every lane that the interpreter
+    # finishes within max_steps. Lanes that touch a negative address or jump to one are
+    # left out: the interpreter's list core wraps those round to the end, where a lane
+    # fails
+    import random
+
+    rnd = random.Random(seed)
+    opcodes = [1, 2, 3, 4, 5, 6, 7, 8, 9, 99]
+    compared = 0
+    for _ in range(n_programs):
+        core = []
+        while len(core) < 24:
+            _opcode = rnd.choice(opcodes)
+            n = param_count[_opcode]
+            modes = [rnd.choice((0, 1, 2)) for _ in range(n)]
+            core += [_opcode + sum(m * 10 ** (i + 2) for i, m in enumerate(modes))]
+            core += [rnd.randrange(-8, 30) for _ in range(n)]
+        core += [99]
+        inputs = [[rnd.randrange(-10, 40) for _ in range(3)] for _ in range(n_lanes)]
+
+        batch = BatchIntCodeComputer(core, n_lanes)
+        for values in zip(*inputs):
+            batch.feed(values)
+        batch.run(max_steps)
+
+        for lane in range(n_lanes):
+            negative = []
+            computer = IntCodeComputer()
+            computer.load_core(core)
+            computer.set_input_buffer(inputs[lane])
+            computer.watch(range(-len(core) - 8, 0), on_read=lambda *a: negative.append(a),
+                           on_write=lambda *a: negative.append(a))
+            computer.state = ProgramState.running
+            try:
+                for _ in range(max_steps):
+                    if computer.state != ProgramState.running or computer.program_counter < 0:
+                        break
+                    computer.step()
+            except Exception:
+                # The interpreter raises on some malformed instructions that just fail a lane
+                continue
+            if negative or computer.program_counter < 0 or computer.state == ProgramState.running or batch.overflow[lane]:
+                continue
+
+            assert batch.state[lane] == computer.state, (core, inputs[lane])
+            assert batch.program_counter[lane] == computer.program_counter, (core, inputs[lane])
+            outputs = batch.outputs[lane, :batch.output_count[lane]].tolist()
+            assert outputs == list(computer.output_buffer), (core, inputs[lane])
+            assert [batch.peek(i)[lane] for i in range(len(computer._core))] == list(computer._core), \
+                (core, inputs[lane])
+            compared += 1
+    return compared
+
+
+if __name__ == "__main__":
+    print(f"{test_against_interpreter()} lanes match the interpreter")
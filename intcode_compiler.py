@@ -0,0 +1,400 @@
+# Block compiler for the int code computer
+#
+# The core is split into basic blocks the first time execution reaches them. A block
+# starts at whatever address we jump to and runs straight through arithmetic, compare
+# and relative base instructions, ending at the first jump. Each block is turned into
+# Python source and compiled into a function, so the dispatch loop goes from block to
+# block instead of decoding one instruction at a time.
+#
+# Input, output and halt are never compiled. They are left to the interpreter, as is
+# anything that doesn't decode cleanly.
+#
+# The program can rewrite itself (see the day 13 notes in the README). Every compiled
+# cell is registered with the interpreter's decoded cells, so a write to one of them,
+# whether from a block or from the interpreter, drops the blocks covering it. A block
+# that writes into compiled code returns straight away so none of its stale instructions
+# run. A block that keeps getting invalidated is given up on and the interpreter takes
+# over at that address.
+#
+# Some programs only ever rewrite operands: day 13 patches the address its screen
+# functions at 549 and 578 read or write on every call. A cell that has invalidated a
+# block is remembered as written, and later compiles read its operand from the core when
+# the block runs instead of baking it in, so the block is no longer dropped for it.
+#
+# One loop shape is common enough in the day 13 program (pcs 481, 507 and 529) to get a
+# superinstruction of its own, see _fuse_countdown().
+
+from intcode import IntCodeComputer, ProgramState, OpCode, param_count
+from intcode_memory import MemoryModel, store
+
+
+class CoreOverflow(Exception):
+    # Raised by a block when a compact core can't hold a value, with the program counter
+    # of the instruction that tried to write it and the relative base at that point
+    pass
+
+
+class CompiledIntCodeComputer(IntCodeComputer):
+    def __init__(self, debug=False, fast=False, memory=MemoryModel.flat, max_block_length=32,
+                 max_recompiles=2, fuse_loops=True):
+        super().__init__(debug=debug, fast=fast, memory=memory)
+        self.max_block_length = max_block_length
+        self.max_recompiles = max_recompiles
+        self.fuse_loops = fuse_loops
+
+    def clone(self):
+        new_computer = super().clone()
+        new_computer.max_block_length = self.max_block_length
+        new_computer.max_recompiles = self.max_recompiles
+        new_computer.fuse_loops = self.fuse_loops
+        new_computer._blocks = self._blocks.copy()
+        new_computer._block_extent = self._block_extent.copy()
+        new_computer._block_cells = {i: entries.copy() for i, entries in self._block_cells.items()}
+        new_computer._recompiles = self._recompiles.copy()
+        new_computer._interpreted = self._interpreted.copy()
+        new_computer._written_code = self._written_code.copy()
+        return new_computer
+
+    def _run(self, output_count=None):
+        # Blocks write to the core directly, so watched memory is left to the interpreter
+        if self._debug or self._read_watches or self._write_watches:
+            super()._run(output_count)
+            return
+
+        self.state = ProgramState.running
+        if output_count is not None and len(self.output_buffer) >= output_count:
+            return
+
+        # Blocks hold on to the set of decoded cells for the whole run, so it can't be
+        # swapped for a copy part way through
+        if self._decode_shared:
+            self._own_decode_cache()
+
+        core = self._core
+        blocks, interpreted = self._blocks, self._interpreted
+        cells, invalidate = self._decoded_cells, self._invalidate_decoded
+        pc, rb = self.program_counter, self.relative_base
+
+        try:
+            while True:
+                block = blocks.get(pc)
+                if block is None and pc not in interpreted:
+                    block = self._compile(pc)
+
+                if block is None:
+                    self.program_counter, self.relative_base = pc, rb
+                    self.step()
+                    core = self._core
+                    pc, rb = self.program_counter, self.relative_base
+                    if self.state != ProgramState.running:
+                        break
+                    if output_count is not None and len(self.output_buffer) >= output_count:
+                        break
+                    continue
+
+                try:
+                    pc, rb = block(core, rb, cells, invalidate)
+                except CoreOverflow as e:
+                    # Nothing of the failed instruction has happened yet, so promote the core
+                    # and carry on from it
+                    pc, rb = e.args
+                    core = self._promote_core()
+        finally:
+            self.program_counter, self.relative_base = pc, rb
+
+    def _clear_decode_cache(self):
+        super()._clear_decode_cache()
+        self._blocks = {}
+        self._block_extent = {}
+        self._block_cells = {}
+        self._recompiles = {}
+        self._interpreted = set()
+        # Compiled cells the program has written to
+        self._written_code = set()
+
+    def _invalidate_decoded(self, i):
+        super()._invalidate_decoded(i)
+        entries = self._block_cells.pop(i, ())
+        if entries:
+            self._written_code.add(i)
+        for entry in entries:
+            self._drop_block(entry)
+
+    def _drop_block(self, entry):
+        if self._blocks.pop(entry, None) is None:
+            return
+
+        for i in range(*self._block_extent.pop(entry)):
+            entries = self._block_cells.get(i)
+            if entries is not None and entry in entries:
+                entries.remove(entry)
+
+        self._recompiles[entry] = self._recompiles.get(entry, 0) + 1
+        if self._recompiles[entry] > self.max_recompiles:
+            self._interpreted.add(entry)
+
+    def _compile(self, entry):
+        if entry < 0:
+            # The interpreter's list core wraps this round to the end
+            self._interpreted.add(entry)
+            return None
+
+        lines = []
+        pc = entry
+        size = len(self._core)
+        n_instructions = 0
+        ends_in_jump = False
+        # Compact cores can overflow on any write, see _run()
+        guard_overflow = self._memory == MemoryModel.compact
+        written = self._written_code
+        fused_end = entry
+        if self.fuse_loops and not written.intersection(range(entry, entry + 11)):
+            fused_end = self._fuse_countdown(lines, entry, size, guard_overflow)
+        # Operand cells read from the core at run time, see the notes at the top
+        dynamic = []
+
+        while n_instructions < self.max_block_length and pc + 4 <= size:
+            _raw_opcode = self.read_value(pc)
+            _opcode = _raw_opcode % 100
+            if _opcode not in _compilable:
+                break
+
+            n = param_count[_opcode]
+            modes = [_raw_opcode // 10 ** (i + 2) % 10 for i in range(n)]
+            args = [self.read_value(pc + i + 1) for i in range(n)]
+            if any(m not in (0, 1, 2) for m in modes):
+                break
+            if _opcode not in _jumps and _opcode != OpCode.adjust_relative_base and modes[-1] == 1:
+                # Writes in immediate mode are an error the interpreter reports
+                break
+
+            cells_read = [pc + i + 1 if pc + i + 1 in written else None for i in range(n)]
+            dynamic += [c for c in cells_read if c is not None]
+            lines += [f"    # [{pc}] {OpCode(_opcode).name}"]
+            # A jump's target is left to its taken branch below
+            n_operands = 1 if _opcode in _jumps else n
+            operands = [self._operand(lines, f"a{n_instructions}_{i}", modes[i], args[i], size, cells_read[i])
+                        for i in range(n_operands)]
+            instruction_pc = pc
+            pc += n + 1
+            n_instructions += 1
+
+            if _opcode in _jumps:
+                test = operands[0] if _opcode == OpCode.jump_if_true else f"not {operands[0]}"
+                taken = []
+                target = self._operand(taken, f"a{n_instructions - 1}_1", modes[1], args[1], size, cells_read[1])
+                lines += [f"    if {test}:"]
+                lines += ["    " + line for line in taken]
+                lines += [f"        return {target}, rb",
+                          f"    return {pc}, rb"]
+                ends_in_jump = True
+                break
+
+            if _opcode == OpCode.adjust_relative_base:
+                lines += [f"    rb += {operands[0]}"]
+                continue
+
+            a, b = operands[0], operands[1]
+            value = {
+                OpCode.add: f"{a} + {b}",
+                OpCode.mul: f"{a} * {b}",
+                OpCode.less_than: f"1 if {a} < {b} else 0",
+                OpCode.equals: f"1 if {a} == {b} else 0",
+            }[_opcode]
+            arg = args[2] if cells_read[2] is None else f"core[{cells_read[2]}]"
+            address = str(arg) if modes[2] == 0 else f"rb + {arg}"
+            if modes[2] == 2 or cells_read[2] is not None:
+                lines += [f"    t = {address}"]
+                address = "t"
+            if address == "t" or args[2] >= size:
+                write = [f"    v = {value}",
+                         "    try:",
+                         f"        core[{address}] = v",
+                         "    except IndexError:",
+                         f"        store(core, {address}, v)"]
+            else:
+                write = [f"    core[{address}] = {value}"]
+            if guard_overflow:
+                write = (["    try:"] +
+                         ["    " + line for line in write] +
+                         ["    except OverflowError:",
+                          f"        raise CoreOverflow({instruction_pc}, rb)"])
+            lines += write
+            lines += [f"    if {address} in cells:",
+                      f"        invalidate({address})",
+                      f"        return {pc}, rb"]
+
+        if n_instructions == 0:
+            self._interpreted.add(entry)
+            return None
+
+        if not ends_in_jump:
+            lines += [f"    return {pc}, rb"]
+
+        source = "\n".join([f"def _block_{entry}(core, rb, cells, invalidate):"] + lines)
+        namespace = {"store": store, "CoreOverflow": CoreOverflow}
+        exec(compile(source, f"<intcode block {entry}>", "exec"), namespace)
+        block = namespace[f"_block_{entry}"]
+
+        pc = max(pc, fused_end)
+        self._blocks[entry] = block
+        self._block_extent[entry] = (entry, pc)
+        for i in range(entry, pc):
+            if i not in dynamic:
+                self._block_cells.setdefault(i, []).append(entry)
+                self._decoded_cells.add(i)
+            elif not self._block_cells.get(i) and not any(j in self._decode_cache for j in range(i - 3, i + 1)):
+                # Nothing has this cell baked in any more, so writing it needn't stop a block
+                self._decoded_cells.discard(i)
+        return block
+
+    def _decode_at(self, pc):
+        # (opcode, [(mode, arg), ...]) of the instruction at pc, or None
+        _raw_opcode = self.read_value(pc)
+        _opcode = _raw_opcode % 100
+        if _opcode not in param_count:
+            return None
+        n = param_count[_opcode]
+        return _opcode, [(_raw_opcode // 10 ** (i + 2) % 10, self.read_value(pc + i + 1)) for i in range(n)]
+
+    def _fuse_countdown(self, lines, entry, size, guard_overflow):
+        # The loop
+        #
+        #   [L]     ADD x, t -> x
+        #   [L + 4] LT x, d -> f
+        #   [L + 8] JMP FALSE f -> L
+        #
+        # keeps adding t (a negative step) to x until x < d. The number of times round can
+        # be worked out up front, so the whole loop becomes a single update of x and f. When
+        # the code at entry is this loop, lines get the fused version, guarded so that it is
+        # only taken when the four cells are distinct, x and f lie outside the loop and the
+        # loop ends. Otherwise the block carries on into the ordinary translation, which runs
+        # one iteration. Returns the end of the loop, or entry when it doesn't match
+        add, lt, jmp = self._decode_at(entry), self._decode_at(entry + 4), self._decode_at(entry + 8)
+        if add is None or lt is None or jmp is None:
+            return entry
+        if (add[0], lt[0], jmp[0]) != (OpCode.add, OpCode.less_than, OpCode.jump_if_false):
+            return entry
+
+        (a, b, x), (x_lt, d, f), (f_jmp, target) = add[1], lt[1], jmp[1]
+        if x not in (a, b) or x_lt != x or f_jmp != f or target != (1, entry):
+            return entry
+        t = b if a == x else a
+        if any(m not in (0, 1, 2) for m, _ in (x, t, d, f)) or x[0] == 1 or f[0] == 1:
+            return entry
+
+        end = entry + 11
+        lines += [f"    # [{entry}] count down loop, fused"]
+        cells_used = []
+        for name, (mode, arg) in (("x", x), ("t", t), ("d", d), ("f", f)):
+            if mode != 1:
+                lines += [f"    {name}_at = {arg if mode == 0 else f'rb + {arg}'}"]
+                cells_used += [f"{name}_at"]
+        # Writing x or f over the loop itself would change it part way round, which the
+        # interpreter sees and the fused version wouldn't
+        lines += [f"    if (min({', '.join(cells_used)}) >= 0 and len({{{', '.join(cells_used)}}}) == {len(cells_used)} and",
+                  f"            not {entry} <= x_at < {end} and not {entry} <= f_at < {end}):"]
+        for name, (mode, arg) in (("x", x), ("t", t), ("d", d)):
+            value = str(arg) if mode == 1 else f"core[{name}_at] if {name}_at < len(core) else 0"
+            lines += [f"        {name} = {value}"]
+        lines += ["        if t < 0:",
+                  "            k = max((x - d) // -t + 1, 1)",
+                  "        else:",
+                  "            k = 1 if x + t < d else 0",
+                  "        if k:"]
+        for name, value in (("x", "x + k * t"), ("f", "1")):
+            write = ["            try:",
+                     f"                core[{name}_at] = {value}",
+                     "            except IndexError:",
+                     f"                store(core, {name}_at, {value})"]
+            if guard_overflow:
+                write = (["            try:"] +
+                         ["    " + line for line in write] +
+                         ["            except OverflowError:",
+                          f"                raise CoreOverflow({entry}, rb)"])
+            lines += write
+        lines += ["            if x_at in cells:",
+                  "                invalidate(x_at)",
+                  "            if f_at in cells:",
+                  "                invalidate(f_at)",
+                  f"            return {end}, rb"]
+        return end
+
+    @staticmethod
+    def _operand(lines, name, mode, arg, size, cell=None):
+        # With cell, the operand is whatever is in that cell when the block runs rather than
+        # arg
+        if cell is not None:
+            if mode == 1:
+                return f"core[{cell}]"
+            lines += [f"    {name} = {'' if mode == 0 else 'rb + '}core[{cell}]"]
+            address = name
+        elif mode == 1:
+            return str(arg)
+        elif mode == 0:
+            if 0 <= arg < size:
+                return f"core[{arg}]"
+            address = str(arg)
+        else:
+            lines += [f"    {name} = rb + {arg}"]
+            address = name
+
+        lines += [f"    {name} = core[{address}] if {address} < len(core) else 0"]
+        return name
+
+
+_jumps = {OpCode.jump_if_true, OpCode.jump_if_false}
+_compilable = {
+    OpCode.add,
+    OpCode.mul,
+    OpCode.jump_if_true,
+    OpCode.jump_if_false,
+    OpCode.less_than,
+    OpCode.equals,
+    OpCode.adjust_relative_base
+}
+
+
+def _check_against_interpreter(core):
+    # Runs core on both computers and checks they end up the same
+    interpreted = IntCodeComputer()
+    interpreted.load_core(core)
+    interpreted.run()
+    compiled = CompiledIntCodeComputer()
+    compiled.load_core(core)
+    compiled.run()
+    assert list(compiled.output_buffer) == list(interpreted.output_buffer)
+    assert list(compiled._core) == list(interpreted._core)
+    assert compiled.state == interpreted.state
+    assert compiled.program_counter == interpreted.program_counter
+
+
+def test_fused_loop_writing_itself():
+    # The count down loop at 3 writes its flag into the loop's own code at 10, turning the
+    # LT into an ADD part way round. Fusing it would skip that and print 1
+    _check_against_interpreter([1105, 1, 3, 1001, 10, -1, 10, 7, 10, 0, 17, 1006, 17, 3, 4, 17, 99, 0])
+
+
+def test_operand_written_over_interpreted_opcode():
+    # Cell 5 is a written operand of the block at 4, read from the core when it runs, and
+    # also the opcode of the OUTPUT the interpreter decodes at 5. Rewriting it has to drop
+    # that decoded OUTPUT, or it prints a second time
+    _check_against_interpreter([1105, 1, 4, 21, 1001, 5, -1, 5, 7, 5, 0, 16, 1006, 16, 4, 1105, 2, 1, 99, 0, 0, 0])
+
+
+def test_negative_jump():
+    # The interpreter's list core wraps a jump to -5 round to the ADD at 3, which a block
+    # can't be compiled for
+    _check_against_interpreter([1105, 1, -5, 1101, 2, 3, 0, 99])
+
+
+def test_jump_not_taken():
+    # The JMP TRUE at 0 isn't taken, so its target at -50 is never read
+    _check_against_interpreter([5, 9, -50, 104, 7, 99, 0, 0, 0, 0])
+
+
+if __name__ == "__main__":
+    test_fused_loop_writing_itself()
+    test_operand_written_over_interpreted_opcode()
+    test_negative_jump()
+    test_jump_not_taken()
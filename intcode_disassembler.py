@@ -0,0 +1,348 @@
+# Disassembler and static analyzer for int code cores
+#
+# Code is found by following control flow from address 0 rather than by decoding the core
+# from start to end, since data (variables, the day 13 screen) sits in between and would
+# otherwise decode as nonsense.
+#
+# The programs we've seen call functions with a common pattern. The caller writes the
+# return address to the top of the stack and jumps:
+#
+#   [ 131] MUL 138, 1 -> [rb+0]
+#   [ 135] JMP TRUE 1 -> 549
+#
+# and the function adjusts the relative base back and jumps to whatever is stored there:
+#
+#   [ 573] RELBASE -4
+#   [ 575] JMP TRUE 1 -> [rb+0]
+#
+# A jump through the stack can't be followed statically, so the pair is recognised
+# instead: the call continues at the return address it stored, the jump target becomes a
+# function entry, and the jump through the stack is marked as a return. Functions are
+# the blocks reachable from an entry without following calls.
+#
+# Whatever isn't code is data. Immediate operands of ADD that point into the data are
+# taken to be the base addresses of tables (day 13's screen at 639 and score table at
+# 1651), and the data is split into regions at them and at cells used as variables.
+
+import sys
+
+from intcode import OpCode, ParamMode, param_count
+
+mnemonics = {
+    OpCode.add: "ADD",
+    OpCode.mul: "MUL",
+    OpCode.save_input: "INP",
+    OpCode.output: "OUT",
+    OpCode.jump_if_true: "JMP TRUE",
+    OpCode.jump_if_false: "JMP FALSE",
+    OpCode.less_than: "LT",
+    OpCode.equals: "EQ",
+    OpCode.adjust_relative_base: "RELBASE",
+    OpCode.halt: "HLT"
+}
+
+# Opcodes whose last parameter is written to
+writes = {OpCode.add, OpCode.mul, OpCode.save_input, OpCode.less_than, OpCode.equals}
+jumps = {OpCode.jump_if_true, OpCode.jump_if_false}
+
+
+class Instruction:
+    def __init__(self, pc, opcode, modes, args):
+        self.pc = pc
+        self.opcode = opcode
+        self.modes = modes
+        self.args = args
+        self.length = len(args) + 1
+        # Set when the program writes to one of this instruction's cells
+        self.modified = False
+
+    def constant(self):
+        # The value an ADD or MUL of two immediates writes, otherwise None
+        if self.opcode in (OpCode.add, OpCode.mul) and self.modes[:2] == [ParamMode.value] * 2:
+            a, b = self.args[:2]
+            return a + b if self.opcode == OpCode.add else a * b
+        return None
+
+    def always_jumps(self):
+        if self.modes[0] != ParamMode.value:
+            return False
+        return (self.args[0] != 0) == (self.opcode == OpCode.jump_if_true)
+
+    def never_jumps(self):
+        if self.modes[0] != ParamMode.value:
+            return False
+        return (self.args[0] != 0) != (self.opcode == OpCode.jump_if_true)
+
+    def __str__(self):
+        operands = ", ".join(_operand(m, a) for m, a in zip(self.modes, self.args))
+        if self.opcode in writes:
+            *inputs, output = [_operand(m, a) for m, a in zip(self.modes, self.args)]
+            operands = ", ".join(inputs) + (" -> " if inputs else "-> ") + output
+        elif self.opcode in jumps:
+            operands = f"{_operand(self.modes[0], self.args[0])} -> {_operand(self.modes[1], self.args[1])}"
+        text = f"[{self.pc:#4}] {mnemonics[self.opcode]} {operands}".rstrip()
+        return text + ("   ; modified at runtime" if self.modified else "")
+
+
+class BasicBlock:
+    def __init__(self, start):
+        self.start = start
+        self.end = start
+        self.instructions = []
+        # Addresses control can go to from the end of the block, calls excluded
+        self.successors = []
+        # Entry of the function called at the end of the block, if any
+        self.call = None
+        self.returns = False
+
+
+class Function:
+    def __init__(self, entry):
+        self.entry = entry
+        self.blocks = []
+        self.calls = set()
+
+    def extent(self):
+        return min(b.start for b in self.blocks), max(b.end for b in self.blocks)
+
+
+class DataRegion:
+    def __init__(self, start, end, kind):
+        self.start = start
+        self.end = end
+        # "table" when code uses its start as a base address, "variable" when code reads or
+        # writes it directly, otherwise "data"
+        self.kind = kind
+
+
+class Program:
+    def __init__(self, core):
+        self.core = list(core)
+        self.instructions = {}
+        self.blocks = {}
+        self.functions = {}
+        self.data = []
+        # Addresses where control flow couldn't be followed: jumps through memory that aren't
+        # returns, and code that doesn't decode (it may be written at runtime)
+        self.unresolved = []
+
+        self._find_code()
+        self._find_blocks()
+        self._find_functions()
+        self._find_data()
+
+    def _decode(self, pc):
+        core = self.core
+        if not 0 <= pc < len(core):
+            return None
+        opcode = core[pc] % 100
+        if core[pc] < 0 or opcode not in param_count:
+            return None
+        n = param_count[opcode]
+        if pc + n >= len(core):
+            return None
+        modes = [core[pc] // 10 ** (i + 2) % 10 for i in range(n)]
+        if core[pc] // 10 ** (n + 2) or any(m > 2 for m in modes):
+            return None
+        if opcode in writes and modes[-1] == 1:
+            return None
+        return Instruction(pc, OpCode(opcode), [_mode_of[m] for m in modes], core[pc + 1:pc + n + 1])
+
+    def _successors(self, instruction):
+        # (next addresses, called function entry, whether it returns)
+        pc, next_pc = instruction.pc, instruction.pc + instruction.length
+        if instruction.opcode == OpCode.halt:
+            return [], None, False
+        if instruction.opcode not in jumps:
+            return [next_pc], None, False
+
+        mode, target = instruction.modes[1], instruction.args[1]
+        if instruction.never_jumps():
+            return [next_pc], None, False
+        if mode == ParamMode.relative and instruction.always_jumps():
+            return [], None, True
+
+        targets = [] if instruction.always_jumps() else [next_pc]
+        if mode != ParamMode.value:
+            return targets, None, False
+        targets += [target]
+
+        previous = self.instructions.get(pc - 4)
+        if (instruction.always_jumps() and previous is not None and
+                previous.modes[-1] == ParamMode.relative and previous.constant() == next_pc):
+            return [next_pc], target, False
+        return targets, None, False
+
+    def _find_code(self):
+        work = [0]
+        while work:
+            pc = work.pop()
+            while pc not in self.instructions:
+                instruction = self._decode(pc)
+                if instruction is None:
+                    self.unresolved += [pc]
+                    break
+                self.instructions[pc] = instruction
+                successors, call, returns = self._successors(instruction)
+                if instruction.opcode in jumps and instruction.modes[1] != ParamMode.value and not returns:
+                    self.unresolved += [pc]
+                if call is not None:
+                    work += [call]
+                if not successors:
+                    break
+                work += successors[1:]
+                pc = successors[0]
+
+        # Cells the program writes through direct addresses. The address of an instruction
+        # that is itself modified means nothing, so repeat until that settles
+        changed = True
+        while changed:
+            written = {i.args[-1] for i in self.instructions.values()
+                       if i.opcode in writes and i.modes[-1] == ParamMode.reference and not i.modified}
+            changed = False
+            for instruction in self.instructions.values():
+                modified = any(c in written for c in range(instruction.pc, instruction.pc + instruction.length))
+                if modified != instruction.modified:
+                    instruction.modified = modified
+                    changed = True
+
+    def _find_blocks(self):
+        leaders = {0}
+        for instruction in self.instructions.values():
+            successors, call, _ = self._successors(instruction)
+            if instruction.opcode in jumps or instruction.opcode == OpCode.halt:
+                leaders.update(successors)
+                leaders.add(instruction.pc + instruction.length)
+            if call is not None:
+                leaders.add(call)
+
+        for leader in sorted(leaders):
+            if leader not in self.instructions:
+                continue
+            block = BasicBlock(leader)
+            pc = leader
+            while True:
+                instruction = self.instructions[pc]
+                block.instructions += [instruction]
+                block.end = pc + instruction.length
+                successors, call, returns = self._successors(instruction)
+                if instruction.opcode in jumps or instruction.opcode == OpCode.halt:
+                    block.successors, block.call, block.returns = successors, call, returns
+                    break
+                pc = successors[0]
+                if pc in leaders or pc not in self.instructions:
+                    block.successors = [pc] if pc in self.instructions else []
+                    break
+            self.blocks[leader] = block
+
+    def _find_functions(self):
+        entries = {0} | {b.call for b in self.blocks.values() if b.call is not None}
+        for entry in sorted(entries):
+            function = Function(entry)
+            seen = {entry}
+            work = [entry]
+            while work:
+                block = self.blocks.get(work.pop())
+                if block is None:
+                    continue
+                function.blocks += [block]
+                if block.call is not None:
+                    function.calls.add(block.call)
+                for s in block.successors:
+                    if s not in seen and s not in entries:
+                        seen.add(s)
+                        work += [s]
+            function.blocks.sort(key=lambda b: b.start)
+            self.functions[entry] = function
+
+    def _find_data(self):
+        code = set()
+        for instruction in self.instructions.values():
+            code.update(range(instruction.pc, instruction.pc + instruction.length))
+
+        variables, tables = set(), set()
+        for instruction in self.instructions.values():
+            for mode, arg in zip(instruction.modes, instruction.args):
+                if mode == ParamMode.reference and arg not in code:
+                    variables.add(arg)
+            # A base address plus an index, one immediate and one not
+            if instruction.opcode == OpCode.add and instruction.modes[:2].count(ParamMode.value) == 1:
+                for mode, arg in zip(instruction.modes[:2], instruction.args[:2]):
+                    if mode == ParamMode.value and 0 <= arg < len(self.core) and arg not in code:
+                        tables.add(arg)
+        tables -= variables
+
+        start = None
+        for i in range(len(self.core) + 1):
+            boundary = i == len(self.core) or i in code or i in variables or i in tables
+            if start is not None and boundary:
+                self.data += [DataRegion(start, i, "table" if start in tables else "data")]
+                start = None
+            if i < len(self.core) and i in variables:
+                self.data += [DataRegion(i, i + 1, "variable")]
+            elif i < len(self.core) and i not in code and start is None:
+                start = i
+
+    def listing(self):
+        lines = []
+        regions = {r.start: r for r in self.data}
+        i = 0
+        while i < len(self.core):
+            if i in self.functions:
+                lines += ["", f"function {i}:"]
+            if i in self.instructions:
+                lines += [str(self.instructions[i])]
+                i += self.instructions[i].length
+            else:
+                region = regions[i]
+                values = self.core[region.start:region.end]
+                shown = ", ".join(str(v) for v in values[:8]) + (", ..." if len(values) > 8 else "")
+                lines += [f"[{i:#4}] {region.kind} ({region.end - region.start}): {shown}"]
+                i = region.end
+        return lines
+
+    def cfg(self):
+        lines = []
+        for entry, function in self.functions.items():
+            start, end = function.extent()
+            calls = ", ".join(str(c) for c in sorted(function.calls))
+            lines += ["", f"function {entry} [{start}, {end})" + (f" calls {calls}" if calls else "")]
+            for block in function.blocks:
+                exits = [str(s) for s in block.successors]
+                if block.call is not None:
+                    exits += [f"call {block.call}"]
+                if block.returns:
+                    exits += ["return"]
+                lines += [f"  {block.start:5} -> " + ", ".join(exits)]
+        return lines
+
+
+def _operand(mode, arg):
+    if mode == ParamMode.value:
+        return f"{arg}"
+    if mode == ParamMode.reference:
+        return f"[{arg}]"
+    return f"[rb{arg:+}]"
+
+
+# Mode digits as the computer reads them, see IntCodeComputer._extract_params
+_mode_of = {0: ParamMode.reference, 1: ParamMode.value, 2: ParamMode.relative}
+
+
+def main():
+    with open(sys.argv[1], "r") as f:
+        core = [int(c) for c in f.readline().strip().split(",")]
+
+    program = Program(core)
+    print("\n".join(program.listing()))
+    print("\n".join(program.cfg()))
+    print()
+    for region in program.data:
+        if region.kind == "table":
+            print(f"table at {region.start}, {region.end - region.start} cells")
+    if program.unresolved:
+        print("control flow not followed at " + ", ".join(str(pc) for pc in sorted(set(program.unresolved))))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,274 @@
+# Mapping an unknown grid with an int code robot
+#
+# The robot takes a move (1 north, 2 south, 3 west, 4 east) and answers with a status: 0
+# when a wall is in the way, anything else when it moved, the value saying what it found
+# there (day 15 uses 1 for open floor and 2 for the oxygen system).
+#
+# The explorer maps everything reachable in one breadth first pass and keeps the map, so
+# distances, paths and flood fills are then answered from the map without running the
+# robot again.
+#
+# How the robot gets to a frontier cell to try the moves from it is up to the strategy:
+#
+#   CloneStrategy     every frontier cell keeps its own clone of the computer
+#   SnapshotStrategy  one computer, restored from a snapshot kept for every frontier cell
+#   WalkStrategy      one computer, which walks to the cell along the map made so far
+#
+# A frontier limit bounds the clones or snapshots held. Cells found while the frontier is
+# full are kept without a state, and a walking robot expands them when their turn comes.
+#
+# explore_depth_first maps with the one computer and nothing else: the robot goes as deep
+# as it can and walks back the way it came to backtrack. The only memory it needs beyond
+# the core and the map is the path back, however open the area is.
+#
+# explore_parallel is the breadth first search with each level's moves spread over a
+# process pool. Workers are sent snapshots and send back the status and a snapshot of the
+# robot after the move. A cell two frontier cells could move to is only tried from the
+# first of them, in the order the level was found, so the map and the frontier come out
+# as they would from explore.
+
+import os
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+
+from grid import Grid
+
+news = {
+    1: (0, 1),
+    2: (0, -1),
+    3: (-1, 0),
+    4: (1, 0)
+}
+
+opposite = {1: 2, 2: 1, 3: 4, 4: 3}
+
+wall = 0
+# What the map holds for cells the robot hasn't tried
+unknown = 255
+
+
+def new_loc(loc, move):
+    m = news[move]
+    return loc[0] + m[0], loc[1] + m[1]
+
+
+def send_move(computer, move):
+    computer.set_input_buffer([move])
+    computer.run_until_output()
+    return computer.output_buffer.popleft()
+
+
+# Each worker process gets the computer once, when it starts, and restores snapshots onto it
+_worker_computer = None
+
+
+def _init_worker(computer):
+    global _worker_computer
+    _worker_computer = computer
+
+
+def _expand(task):
+    snapshot, move = task
+    _worker_computer.restore(snapshot)
+    status = send_move(_worker_computer, move)
+    return status, _worker_computer.snapshot()
+
+
+class CloneStrategy:
+    def root(self, explorer, computer):
+        return computer
+
+    def move(self, explorer, state, loc, move):
+        computer = state.clone()
+        return send_move(computer, move), computer
+
+
+class SnapshotStrategy:
+    def root(self, explorer, computer):
+        self.computer = computer
+        return computer.snapshot()
+
+    def move(self, explorer, state, loc, move):
+        self.computer.restore(state)
+        status = send_move(self.computer, move)
+        return status, self.computer.snapshot()
+
+
+class WalkStrategy:
+    # There is only ever the one robot. The frontier holds no state at all
+    def root(self, explorer, computer):
+        self.computer = computer
+        self.loc = explorer.start
+        return None
+
+    def move(self, explorer, state, loc, move):
+        for step in explorer.shortest_path(self.loc, loc):
+            if send_move(self.computer, step) == wall:
+                raise RuntimeError(f"Robot walked into a wall going from {self.loc} to {loc}")
+        self.loc = loc
+
+        status = send_move(self.computer, move)
+        if status != wall:
+            self.loc = new_loc(loc, move)
+        return status, None
+
+
+class Explorer:
+    def __init__(self, computer, strategy=None, start=(0, 0), max_frontier=None):
+        self.computer = computer
+        self.strategy = strategy if strategy is not None else CloneStrategy()
+        self.start = start
+        self.max_frontier = max_frontier
+        # loc -> status, walls included
+        self.map = Grid(default=unknown)
+        self.depth = 0
+
+    def explore(self, on_expand=None):
+        # Maps everything the robot can reach. on_expand(explorer, depth, frontier size) is
+        # called after each cell is expanded
+        self.new_map()
+        walker = None
+        if self.max_frontier is not None and not isinstance(self.strategy, WalkStrategy):
+            walker = WalkStrategy()
+            walker.root(self, self.computer.clone())
+
+        frontier = deque([(self.start, 0, self.strategy.root(self, self.computer))])
+        stored = 1
+        while frontier:
+            loc, depth, state = frontier.popleft()
+            self.depth = depth
+            strategy = self.strategy
+            if state is None and walker is not None:
+                strategy = walker
+            elif state is not None:
+                stored -= 1
+
+            for move in news:
+                loc2 = new_loc(loc, move)
+                if loc2 in self.map:
+                    continue
+                status, state2 = strategy.move(self, state, loc, move)
+                self.map[loc2] = status
+                if status == wall:
+                    continue
+                if self.max_frontier is not None and stored >= self.max_frontier:
+                    state2 = None
+                if state2 is not None:
+                    stored += 1
+                frontier.append((loc2, depth + 1, state2))
+
+            if on_expand:
+                on_expand(self, depth, len(frontier))
+        return self.map
+
+    def explore_depth_first(self, on_expand=None):
+        # Maps everything the robot can reach without cloning its computer, which ends up
+        # back at the start. on_expand(explorer, depth, 0) is called after each move
+        computer = self.computer
+        self.new_map()
+        loc = self.start
+        path = []
+        while True:
+            for move in news:
+                loc2 = new_loc(loc, move)
+                if loc2 not in self.map:
+                    break
+            else:
+                # Nothing left to try here, so back up a step
+                if not path:
+                    break
+                move = opposite[path.pop()]
+                if send_move(computer, move) == wall:
+                    raise RuntimeError(f"Robot walked into a wall backing up from {loc}")
+                loc = new_loc(loc, move)
+                continue
+
+            status = send_move(computer, move)
+            self.map[loc2] = status
+            if status != wall:
+                path.append(move)
+                loc = loc2
+                self.depth = len(path)
+                if on_expand:
+                    on_expand(self, self.depth, 0)
+        return self.map
+
+    def explore_parallel(self, workers=None, on_expand=None):
+        # Maps everything the robot can reach a level at a time over a process pool.
+        # on_expand(explorer, depth, frontier size) is called after each level
+        workers = workers or os.cpu_count() or 1
+        self.new_map()
+        frontier = [(self.start, self.computer.snapshot())]
+        depth = 0
+        with ProcessPoolExecutor(max_workers=workers, initializer=_init_worker,
+                                 initargs=(self.computer.clone(),)) as pool:
+            while frontier:
+                self.depth = depth
+                targets, tasks = [], []
+                tried = set()
+                for loc, snapshot in frontier:
+                    for move in news:
+                        loc2 = new_loc(loc, move)
+                        if loc2 in self.map or loc2 in tried:
+                            continue
+                        tried.add(loc2)
+                        targets += [loc2]
+                        tasks += [(snapshot, move)]
+
+                chunk_size = max(1, len(tasks) // (workers * 4))
+                frontier = []
+                for loc2, (status, snapshot) in zip(targets, pool.map(_expand, tasks, chunksize=chunk_size)):
+                    self.map[loc2] = status
+                    if status != wall:
+                        frontier += [(loc2, snapshot)]
+
+                if on_expand:
+                    on_expand(self, depth, len(frontier))
+                depth += 1
+        return self.map
+
+    def new_map(self):
+        self.map = Grid(default=unknown)
+        self.map[self.start] = 1
+        return self.map
+
+    def find(self, status):
+        return self.map.find(status)
+
+    def open_neighbours(self, loc):
+        for move in news:
+            loc2 = new_loc(loc, move)
+            if self.map.get(loc2, wall) != wall:
+                yield move, loc2
+
+    def distances(self, source):
+        # Flood fill from source: steps to every cell reachable on the map
+        dist = {source: 0}
+        q = deque([source])
+        while q:
+            loc = q.popleft()
+            for _, loc2 in self.open_neighbours(loc):
+                if loc2 not in dist:
+                    dist[loc2] = dist[loc] + 1
+                    q.append(loc2)
+        return dist
+
+    def shortest_path(self, start, goal):
+        # The moves that take the robot from start to goal over the map, None if there is no way
+        came_from = {start: None}
+        q = deque([start])
+        while q and goal not in came_from:
+            loc = q.popleft()
+            for move, loc2 in self.open_neighbours(loc):
+                if loc2 not in came_from:
+                    came_from[loc2] = (loc, move)
+                    q.append(loc2)
+        if goal not in came_from:
+            return None
+
+        path = []
+        loc = goal
+        while came_from[loc] is not None:
+            loc, move = came_from[loc]
+            path.append(move)
+        return path[::-1]
@@ -0,0 +1,198 @@
+# Alternative memory layouts for the int code computer core
+#
+# The computer only needs list-like behaviour from its core: len() as the extent of
+# memory in use (anything at or past it reads as 0), indexing, and for writes past the
+# end either growing by itself or raising IndexError so store() can extend() it. A plain
+# list is the default and fastest. The classes here trade a little speed per access for
+# cheaper copies or a smaller footprint.
+#
+# A compact core is an array of machine words. Writing a value that doesn't fit raises
+# OverflowError, and the computer then swaps the array for a list and carries on.
+
+from array import array
+from enum import IntEnum
+
+
+class MemoryModel(IntEnum):
+    flat = 0
+    paged = 1
+    segmented = 2
+    compact = 3
+
+
+class PagedMemory:
+    # The core is split into fixed size pages. A copy shares all of its pages with the
+    # original and a page is only duplicated the first time either side writes to it,
+    # so copying costs the page table and each later write costs at most one page.
+
+    def __init__(self, core=(), page_bits=6):
+        self._bits = page_bits
+        self._mask = (1 << page_bits) - 1
+        self._pages = []
+        self._owned = set()
+        self._size = 0
+        self.extend(core)
+
+    def __len__(self):
+        return self._size
+
+    def __getitem__(self, i):
+        if i < 0:
+            i += self._size
+        if not 0 <= i < self._size:
+            raise IndexError("memory index out of range")
+        return self._pages[i >> self._bits][i & self._mask]
+
+    def __setitem__(self, i, v):
+        if i < 0:
+            i += self._size
+        if not 0 <= i < self._size:
+            raise IndexError("memory index out of range")
+        p = i >> self._bits
+        if p not in self._owned:
+            self._pages[p] = self._pages[p].copy()
+            self._owned.add(p)
+        self._pages[p][i & self._mask] = v
+
+    def __iter__(self):
+        for i in range(self._size):
+            yield self._pages[i >> self._bits][i & self._mask]
+
+    def __repr__(self):
+        return repr(list(self))
+
+    def extend(self, values):
+        for v in values:
+            p = self._size >> self._bits
+            if p == len(self._pages):
+                self._pages.append([0] * (self._mask + 1))
+                self._owned.add(p)
+            self._size += 1
+            self[self._size - 1] = v
+
+    def copy(self):
+        new_memory = PagedMemory(page_bits=self._bits)
+        new_memory._pages = self._pages.copy()
+        new_memory._size = self._size
+        # Every page is now shared, so neither side may write to one in place
+        self._owned = set()
+        return new_memory
+
+
+class SegmentedMemory:
+    # The program sits in a dense array of machine words and everything written past it
+    # goes into pages kept in a dict, so a write far away (a relative base stack, say)
+    # only allocates the one page it lands on. Untouched cells read as 0 without
+    # allocating anything. Writes past the end never fail, they just move the extent.
+    # Like a compact core, the dense part becomes a list once a value doesn't fit.
+
+    def __init__(self, core=(), page_bits=8):
+        self._bits = page_bits
+        self._mask = (1 << page_bits) - 1
+        try:
+            self._dense = array("q", core)
+        except OverflowError:
+            self._dense = list(core)
+        self._pages = {}
+        self._size = len(self._dense)
+
+    def __len__(self):
+        return self._size
+
+    def __getitem__(self, i):
+        if i < 0:
+            i += self._size
+            if i < 0:
+                raise IndexError("memory index out of range")
+        if i < len(self._dense):
+            return self._dense[i]
+        if i >= self._size:
+            raise IndexError("memory index out of range")
+
+        page = self._pages.get(i >> self._bits)
+        return 0 if page is None else page[i & self._mask]
+
+    def __setitem__(self, i, v):
+        if i < 0:
+            i += self._size
+            if i < 0:
+                raise IndexError("memory index out of range")
+        if i < len(self._dense):
+            try:
+                self._dense[i] = v
+            except OverflowError:
+                self._dense = list(self._dense)
+                self._dense[i] = v
+            return
+
+        page = self._pages.get(i >> self._bits)
+        if page is None:
+            page = self._pages[i >> self._bits] = [0] * (self._mask + 1)
+        page[i & self._mask] = v
+        if i >= self._size:
+            self._size = i + 1
+
+    def __iter__(self):
+        for i in range(self._size):
+            yield self[i]
+
+    def __repr__(self):
+        return f"{list(self._dense)!r} + {len(self._pages)} pages up to {self._size}"
+
+    def extend(self, values):
+        for v in values:
+            self[self._size] = v
+
+    def copy(self):
+        new_memory = SegmentedMemory(self._dense, page_bits=self._bits)
+        new_memory._pages = {p: page.copy() for p, page in self._pages.items()}
+        new_memory._size = self._size
+        return new_memory
+
+    def changed_cells(self, image):
+        changes = {i: v for i, (v, b) in enumerate(zip(self._dense, image)) if v != b}
+        for p, page in self._pages.items():
+            for j, v in enumerate(page):
+                i = (p << self._bits) + j
+                if i < len(self._dense):
+                    continue
+                if v != (image[i] if i < len(image) else 0):
+                    changes[i] = v
+        return changes
+
+
+def create_memory(model, core):
+    # Memory of the given model holding a copy of core. Copying memory that is already of
+    # the right kind uses its own copy(), which is what makes paged clones cheap
+    if model == MemoryModel.paged:
+        return core.copy() if isinstance(core, PagedMemory) else PagedMemory(core)
+    if model == MemoryModel.segmented:
+        return core.copy() if isinstance(core, SegmentedMemory) else SegmentedMemory(core)
+    if model == MemoryModel.compact:
+        # Machine words where the values fit, otherwise the same list a flat core uses
+        try:
+            return array("q", core)
+        except OverflowError:
+            return list(core)
+    return list(core)
+
+
+def store(core, i, v):
+    # Write v at i, growing memory that can't grow by itself
+    try:
+        core[i] = v
+    except IndexError:
+        core.extend([0] * (i + 1 - len(core)))
+        core[i] = v
+
+
+def changed_cells(core, image):
+    # The cells of core that differ from image, cells past the image counting as 0 there
+    if isinstance(core, SegmentedMemory):
+        return core.changed_cells(image)
+
+    changes = {i: v for i, (v, b) in enumerate(zip(core, image)) if v != b}
+    for i in range(len(image), len(core)):
+        if core[i] != 0:
+            changes[i] = core[i]
+    return changes
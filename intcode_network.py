@@ -0,0 +1,85 @@
+# Networks of int code computers
+#
+# Computers are nodes and a connection carries everything one node outputs into the input
+# of another. Scheduling is cooperative: a node runs until it halts or blocks on input,
+# then whatever it output is routed along its connections and the nodes that received
+# something are queued to run. A node is only ever resumed when it has input to read, so
+# the cost is the instructions executed plus one routing step per time a node blocks,
+# however many nodes there are.
+#
+# When nothing is left to run the network has either halted (every node has) or is
+# deadlocked (some node is still waiting for input nobody is going to send).
+#
+# Output from a node without connections stays in its output buffer.
+
+from collections import deque
+from enum import IntEnum
+
+from intcode import ProgramState
+
+
+class NetworkState(IntEnum):
+    waiting = 0
+    halt = 1
+    deadlock = 2
+    error = 3
+
+
+class Network:
+    def __init__(self):
+        self.nodes = {}
+        self.state = NetworkState.waiting
+        self._routes = {}
+        self._ready = deque()
+        self._queued = set()
+
+    def add_node(self, name, computer, initial_input=()):
+        # computer should already have its core loaded, since loading resets its buffers
+        self.nodes[name] = computer
+        self._routes[name] = []
+        computer.input_buffer.extend(initial_input)
+        self._wake(name)
+
+    def connect(self, source, destination):
+        self._routes[source].append(destination)
+
+    def send(self, name, values):
+        # Input from outside the network
+        self.nodes[name].input_buffer.extend(values)
+        self._wake(name)
+
+    def blocked(self):
+        # Nodes that are waiting for input
+        return [name for name, computer in self.nodes.items() if computer.state == ProgramState.awaiting_input]
+
+    def run(self):
+        # Runs until nothing is left to run and returns how that ended. More input can be
+        # sent afterwards and the network run again
+        nodes, routes, ready, queued = self.nodes, self._routes, self._ready, self._queued
+
+        while ready:
+            name = ready.popleft()
+            queued.discard(name)
+            computer = nodes[name]
+            computer.run_until_input_needed()
+            if computer.state == ProgramState.error:
+                self.state = NetworkState.error
+                return self.state
+
+            destinations = routes[name]
+            if destinations and computer.output_buffer:
+                values = computer.output_buffer.drain()
+                for destination in destinations:
+                    nodes[destination].input_buffer.extend(values)
+                    self._wake(destination)
+
+        if all(computer.state == ProgramState.halt for computer in nodes.values()):
+            self.state = NetworkState.halt
+        else:
+            self.state = NetworkState.deadlock
+        return self.state
+
+    def _wake(self, name):
+        if name not in self._queued and self.nodes[name].state not in (ProgramState.halt, ProgramState.error):
+            self._ready.append(name)
+            self._queued.add(name)
@@ -0,0 +1,120 @@
+# Profiler for int code programs
+#
+# Debug mode formats a line of log for every instruction, which is slow and grows without
+# bound. Profiling just counts: how often each address was executed, how often each
+# opcode ran, and for every jump how often it was taken and where to. Execution is also
+# tracked as basic blocks (straight runs of code entered at one address and left at
+# the next jump), giving a graph of which block passes control to which, and how often.
+#
+# Loops show up as the top of the hot spot table and as heavily weighted block edges.
+# The self jumping "return" pattern from day 13 (JMP FALSE 0 -> [2664]) shows up as a
+# block with several outgoing edges.
+
+from intcode import IntCodeComputer, ProgramState, OpCode, param_count
+from intcode_memory import MemoryModel
+
+
+class Profile:
+    def __init__(self):
+        self.instructions = 0
+        self.pc_counts = {}
+        self.opcode_counts = {}
+        # pc -> [taken, not taken]
+        self.jumps = {}
+        # (block, next block) -> count. A block is named by the address it was entered at
+        self.block_edges = {}
+        self.block_counts = {}
+
+    def hot_spots(self, n=20):
+        # The n most executed addresses as (pc, count) pairs
+        return sorted(self.pc_counts.items(), key=lambda item: (-item[1], item[0]))[:n]
+
+    def report(self, n=20, core=None):
+        # Hot spot table, with the opcode at each address when given the core
+        lines = [f"{self.instructions} instructions",
+                 "",
+                 "   pc       count       %  op"]
+        for pc, count in self.hot_spots(n):
+            op = ""
+            if core is not None and pc < len(core) and core[pc] % 100 in param_count:
+                op = OpCode(core[pc] % 100).name
+            lines += [f"{pc:5} {count:11} {100 * count / self.instructions:6.2f}%  {op}"]
+
+        lines += ["", "   pc       taken   not taken"]
+        for pc, (taken, not_taken) in sorted(self.jumps.items(), key=lambda item: -sum(item[1]))[:n]:
+            lines += [f"{pc:5} {taken:11} {not_taken:11}"]
+
+        lines += ["", "opcode        count"]
+        for opcode, count in sorted(self.opcode_counts.items(), key=lambda item: -item[1]):
+            lines += [f"{OpCode(opcode).name:20} {count:11}"]
+        return "\n".join(lines)
+
+    def call_graph(self):
+        # Block transitions, the busiest first
+        lines = [f"{block:5} -> {target:5} {count:11}"
+                 for (block, target), count in sorted(self.block_edges.items(), key=lambda item: -item[1])]
+        return "\n".join(lines)
+
+
+class ProfilingIntCodeComputer(IntCodeComputer):
+    # Always interprets, one step at a time, since that is where the counting is done
+
+    def __init__(self, debug=False, fast=False, memory=MemoryModel.flat):
+        super().__init__(debug=debug, fast=fast, memory=memory)
+        self.profile = Profile()
+        self._block = 0
+
+    def _reset(self):
+        super()._reset()
+        self._block = 0
+        self.profile.block_counts[0] = self.profile.block_counts.get(0, 0) + 1
+
+    def _run(self, output_count=None):
+        self.state = ProgramState.running
+        while self.state == ProgramState.running:
+            if output_count is not None and len(self.output_buffer) >= output_count:
+                break
+            self.step()
+
+    def step(self):
+        pc = self.program_counter
+        # Read before executing, the instruction may overwrite itself
+        raw = self._peek_core(pc)
+        opcode = raw % 100
+        if opcode == OpCode.jump_if_true or opcode == OpCode.jump_if_false:
+            condition = self._condition(pc, raw)
+        super().step()
+        if self.state in (ProgramState.awaiting_input, ProgramState.error):
+            # Nothing was executed
+            return
+
+        profile = self.profile
+        profile.instructions += 1
+        profile.pc_counts[pc] = profile.pc_counts.get(pc, 0) + 1
+        profile.opcode_counts[opcode] = profile.opcode_counts.get(opcode, 0) + 1
+
+        if opcode == OpCode.jump_if_true or opcode == OpCode.jump_if_false:
+            counts = profile.jumps.get(pc)
+            if counts is None:
+                counts = profile.jumps[pc] = [0, 0]
+            taken = (condition != 0) == (opcode == OpCode.jump_if_true)
+            counts[0 if taken else 1] += 1
+            target = self.program_counter
+
+            # Every jump ends a block, taken or not
+            edge = (self._block, target)
+            profile.block_edges[edge] = profile.block_edges.get(edge, 0) + 1
+            profile.block_counts[target] = profile.block_counts.get(target, 0) + 1
+            self._block = target
+
+    def _condition(self, pc, raw):
+        # The value a jump at pc tests, read straight from the core so that the jump's own
+        # read is the only one watches see
+        mode, arg = raw // 100 % 10, self._peek_core(pc + 1)
+        if mode == 1:
+            return arg
+        return self._peek_core(arg if mode == 0 else self.relative_base + arg)
+
+    def _peek_core(self, i):
+        core = self._core
+        return core[i] if i < len(core) else 0